@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tracemalloc
+import render
+from pattern_ir import encode_patterns, layout_row, slice_ir
+from utils import BEATMAP_MARGIN, get_patterns_from_text, create_beatmap_image
+
+# Realistic inputs plus the worst cases for each stage: long (...) and [...] runs and the 128 tile PNG limit
+CORPUS = {
+    "simple": "dkkd dkkd kddk",
+    "example": "(dkdkd)(kdkdk)(dkdkdk)(kdkdkd)(dkdkdkd)(kdkdkdk)",
+    "mixed": "d k (dkd) [kdkd] dd (kdkdk) [dkdkdk] k",
+    "long_1_6": "(" + "dk" * 40 + ")",
+    "long_1_8": "[" + "kd" * 40 + "]",
+    "tiles_128": "dk" * 64,
+    "mixed_128": "(dkdkd)[kdkd] " * 12 + "dkd",
+}
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {
+        "p50_ms": pick(0.50) * 1000,
+        "p90_ms": pick(0.90) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def measure(function, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+
+    # Separate run for memory, tracemalloc slows down the timed ones
+    tracemalloc.start()
+    result = function()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, {**percentiles(samples), "peak_traced_bytes": peak_bytes}
+
+
+def output_bytes(result):
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return sum(len(chunk) for chunk in result)
+    return len(result.data)
+
+
+def run_case(text, iterations, bpm):
+    stages = {}
+
+    patterns, stages["parse"] = measure(lambda: get_patterns_from_text(text), iterations)
+
+    ir, stages["encode_ir"] = measure(lambda: encode_patterns(patterns, render._atlas.ids), iterations)
+
+    chunks = [(render._atlas.get_tile_arrays(ir.tile_ids[i:i + render.CHUNK_SIZE]),
+               layout_row(slice_ir(ir, i, i + render.CHUNK_SIZE), render._atlas.widths, BEATMAP_MARGIN))
+              for i in range(0, len(patterns), render.CHUNK_SIZE)]
+    _, stages["montage"] = measure(lambda: [create_beatmap_image(*chunk) for chunk in chunks], iterations)
+
+    if len(patterns) <= render.CHUNK_SIZE * render.IMAGE_LIMIT:
+        result, stages["png"] = measure(lambda: render.render_png_chunks(ir), iterations)
+        stages["png"]["output_bytes"] = output_bytes(result)
+
+    try:
+        (result, _), stages["gif"] = measure(lambda: render.render_animation(ir, bpm, "gif"), iterations)
+        stages["gif"]["output_bytes"] = output_bytes(result)
+    except ValueError as ve:
+        stages["gif"] = {"error": str(ve)}
+
+    return {"text": text, "tiles": len(patterns), "stages": stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the text -> pattern -> image pipeline.")
+    parser.add_argument("--patterns-folder", default=os.getenv("PATTERNS_FOLDER_PATH", "patterns"))
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--bpm", type=float, default=120.0)
+    parser.add_argument("--case", action="append", choices=sorted(CORPUS), help="Only run these cases.")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args()
+
+    # Same setup as a render worker process, no Discord connection involved
+    render.init_worker(args.patterns_folder)
+
+    report = {
+        "python": sys.version.split()[0],
+        "iterations": args.iterations,
+        "bpm": args.bpm,
+        "cases": {name: run_case(CORPUS[name], args.iterations, args.bpm) for name in args.case or CORPUS},
+    }
+    # ru_maxrss is in kilobytes on Linux
+    report["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
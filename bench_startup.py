@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Scripts rather than modules the bot imports, api_requests also calls the osu! API as soon as it's imported
+SCRIPTS = {"bench", "bench_startup", "api_requests"}
+
+
+def list_modules():
+    # The bot's own modules, every top-level one so a new module is measured without listing it here. Each is
+    # imported on its own in a fresh interpreter so nothing is already cached.
+    return sorted(name[:-len(".py")] for name in os.listdir(ROOT)
+                  if name.endswith(".py") and name[:-len(".py")] not in SCRIPTS)
+
+
+def parse_importtime(stderr):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package", nesting shown by indentation
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                        "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return imports
+
+
+def measure_import(module, top):
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             capture_output=True, text=True, cwd=ROOT)
+    imports = parse_importtime(process.stderr)
+    if process.returncode != 0:
+        return {"error": process.stderr.strip().splitlines()[-1]}
+
+    # A module is listed after everything it imported, the interpreter's own startup imports come before that
+    end = max(i for i, entry in enumerate(imports) if entry["module"] == module and entry["depth"] == 0)
+    start = end
+    while start > 0 and imports[start - 1]["depth"] > 0:
+        start -= 1
+    total, dependencies = imports[end], imports[start:end]
+
+    heaviest = sorted(dependencies, key=lambda entry: entry["self_ms"], reverse=True)[:top]
+    return {
+        "cumulative_ms": total["cumulative_ms"],
+        "self_ms": total["self_ms"],
+        "modules_imported": len(dependencies),
+        "direct_imports_ms": {entry["module"]: entry["cumulative_ms"] for entry in dependencies if entry["depth"] == 1},
+        "heaviest_self_ms": {entry["module"]: entry["self_ms"] for entry in heaviest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark how long each of the bot's modules takes to import.")
+    parser.add_argument("--module", action="append", help="Only measure these modules.")
+    parser.add_argument("--top", type=int, default=5, help="How many of the slowest dependencies to list.")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version.split()[0],
+        "modules": {module: measure_import(module, args.top) for module in args.module or list_modules()},
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import time
+import asyncio
+import multiprocessing
+from collections import deque, namedtuple
+
+# At least this many, a lane sizes its board from how many jobs its running renders can submit. Cancelled jobs
+# hold their slot until their worker reaches the next check, if every slot is taken acquire() waits for one.
+CANCEL_SLOTS = 256
+
+# slot in the pool's cancellation flags, deadline as a time.time() timestamp, so it means the same in every process
+RenderToken = namedtuple("RenderToken", ["slot", "deadline"])
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+def check_cancelled(flags, token):
+    # Called by the workers between frames and chunks, cheap enough to call for every frame
+    if token is None:
+        return
+    if flags[token.slot]:
+        raise RenderCancelled("El render se canceló.")
+    if time.time() > token.deadline:
+        raise RenderCancelled("El render tardó demasiado y se canceló.")
+
+
+class CancelBoard:
+    # Cancellation flags in shared memory, handed to a pool's workers when they start, one slot per submitted job
+
+    def __init__(self, slots=CANCEL_SLOTS):
+        self.flags = multiprocessing.RawArray("b", slots)
+        self.free = list(range(slots))
+        # Futures of acquire() calls waiting for a slot, in arrival order
+        self.waiters = deque()
+
+    async def acquire(self, deadline):
+        while not self.free:
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Woken right as the caller was cancelled, the slot goes to the next waiter
+                if future.done() and not future.cancelled():
+                    self._wake()
+                raise
+
+        slot = self.free.pop()
+        self.flags[slot] = 0
+        return RenderToken(slot, deadline)
+
+    def cancel(self, token):
+        self.flags[token.slot] = 1
+
+    def release(self, token):
+        self.free.append(token.slot)
+        self._wake()
+
+    def _wake(self):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+
+    async def run(self, pool, deadline, function, *args):
+        # Runs function(*args, token=token) in pool. If the caller is cancelled, a job still waiting in the pool is
+        # dropped and a running one stops at its next check_cancelled, the slot is only reused once the job is over.
+        if time.time() > deadline:
+            raise RenderCancelled("El render tardó demasiado y se canceló.")
+
+        loop = asyncio.get_running_loop()
+        token = await self.acquire(deadline)
+        future = pool.submit(function, *args, token=token)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.release, token))
+
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self.cancel(token)
+            raise
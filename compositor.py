@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def div255(values):
+    # Same rounding PIL uses when blending, so the results are pixel-identical to Image.paste
+    values = values + 128
+    return (values + (values >> 8)) >> 8
+
+
+def blend_over(dst, src):
+    # In-place equivalent of Image.paste(src, box, src): every channel, alpha included, is blended by src's alpha
+    mask = src[..., 3:4].astype(np.uint32)
+    dst[...] = div255(dst.astype(np.uint32) * (255 - mask) + src.astype(np.uint32) * mask)
+
+
+def blend_on_blank(src):
+    # What pasting src onto a transparent black canvas produces, precomputed so it can be copied straight in
+    mask = src[..., 3:4].astype(np.uint32)
+    return div255(src.astype(np.uint32) * mask).astype(np.uint8)
+
+
+def composite_row(canvas, tiles, x_offsets):
+    # tiles are (array, blank_array) pairs laid out left to right, canvas must start fully transparent
+    canvas_width = canvas.shape[1]
+    painted_until = 0
+
+    for (array, blank_array), x in zip(tiles, x_offsets):
+        left = max(x, 0)
+        right = min(x + array.shape[1], canvas_width)
+        if left >= right:
+            continue
+
+        if left >= painted_until:
+            canvas[:, left:right] = blank_array[:, left - x:right - x]
+        else:
+            blend_over(canvas[:, left:right], array[:, left - x:right - x])
+
+        painted_until = max(painted_until, right)
+
+    return canvas
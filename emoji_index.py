@@ -0,0 +1,31 @@
+class EmojiIndex:
+    # name -> {emoji id: emoji}, so an emoji name shared by several guilds survives one of them removing it
+
+    def __init__(self):
+        self.by_name = {}
+
+    def __len__(self):
+        return sum(len(emojis) for emojis in self.by_name.values())
+
+    def add(self, emojis):
+        for emoji in emojis:
+            self.by_name.setdefault(emoji.name, {})[emoji.id] = emoji
+
+    def remove(self, emojis):
+        for emoji in emojis:
+            same_name = self.by_name.get(emoji.name)
+            if same_name is None:
+                continue
+            same_name.pop(emoji.id, None)
+            if not same_name:
+                del self.by_name[emoji.name]
+
+    def rebuild(self, emojis):
+        self.by_name.clear()
+        self.add(emojis)
+
+    def get(self, name):
+        same_name = self.by_name.get(name)
+        if not same_name:
+            return None
+        return next(iter(same_name.values()))
@@ -0,0 +1,218 @@
+import io
+import zlib
+import struct
+import numpy as np
+from collections import namedtuple
+from PIL import Image, GifImagePlugin
+
+# Palette index reserved for fully transparent pixels
+GIF_TRANSPARENT_INDEX = 0
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+APNG_DISPOSE_OP_BACKGROUND = 1
+APNG_BLEND_OP_SOURCE = 0
+
+EncodedAnimation = namedtuple("EncodedAnimation", ["format", "extension", "data", "frame_count"])
+
+
+def to_gif_indexed(frame):
+    # Quantizes into indexes 1-255, index 0 is left for transparency
+    array = np.asarray(frame)
+    indexed = frame.convert("RGB").quantize(colors=255, method=Image.Quantize.FASTOCTREE)
+
+    indices = np.asarray(indexed) + 1
+    indices[array[..., 3] < 128] = GIF_TRANSPARENT_INDEX
+
+    palette = indexed.getpalette()[:255 * 3]
+    indexed = Image.fromarray(indices.astype(np.uint8), "P")
+    indexed.putpalette([0, 0, 0] + palette + [0] * (255 * 3 - len(palette)))
+
+    return indexed
+
+
+def get_opaque_bbox(frame, window=None):
+    # window, when the caller knows it, is the only part of the frame that can have opaque pixels,
+    # the rest of the frame isn't scanned
+    region = frame if window is None else frame.crop(window)
+    if region.mode == "RGBA":
+        region = region.getchannel("A")
+
+    bbox = region.getbbox()
+    if bbox is None:
+        return 0, 0, 1, 1
+    if window is not None:
+        bbox = (bbox[0] + window[0], bbox[1] + window[1], bbox[2] + window[0], bbox[3] + window[1])
+    return bbox
+
+
+class GifStreamWriter:
+    # Encodes each frame as soon as it's written, so only the frame being encoded is kept in memory.
+    # With a palette, frames are "P" images already in it and share the global colour table,
+    # without one, RGBA frames are quantized one by one into their own local colour table.
+
+    def __init__(self, fp, duration, loop=0, disposal=2, palette=None):
+        self.fp = fp
+        self.duration = duration
+        self.loop = loop
+        self.disposal = disposal
+        self.palette = palette
+        self.frame_count = 0
+
+    def write(self, frame, window=None):
+        if self.frame_count == 0:
+            canvas = Image.new("P", frame.size, GIF_TRANSPARENT_INDEX)
+            canvas.putpalette(self.palette or [0] * 768)
+            info = {"loop": self.loop, "duration": self.duration, "transparency": GIF_TRANSPARENT_INDEX}
+            header, _ = GifImagePlugin.getheader(canvas, info=info)
+            for block in header:
+                self.fp.write(block)
+
+        indexed = frame if self.palette else to_gif_indexed(frame)
+
+        # With disposal=2 the canvas is cleared between frames, so only the opaque region needs encoding
+        bbox = get_opaque_bbox(indexed, window)
+        indexed = indexed.crop(bbox)
+
+        for block in GifImagePlugin.getdata(indexed, offset=bbox[:2], duration=self.duration, disposal=self.disposal,
+                                            transparency=GIF_TRANSPARENT_INDEX,
+                                            include_color_table=self.palette is None):
+            self.fp.write(block)
+
+        self.frame_count += 1
+
+    def close(self):
+        if self.frame_count:
+            self.fp.write(b";")  # GIF trailer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def _png_chunks(image):
+    with io.BytesIO() as image_binary:
+        image.save(image_binary, "PNG", compress_level=6)
+        data = image_binary.getvalue()
+
+    position = len(PNG_SIGNATURE)
+    while position < len(data):
+        length, = struct.unpack(">I", data[position:position + 4])
+        yield data[position + 4:position + 8], data[position + 8:position + 8 + length]
+        position += length + 12
+
+
+class ApngStreamWriter:
+    # APNG needs the frame count in acTL before the first frame, the scroll renderer knows it up front
+
+    def __init__(self, fp, duration, frame_count, loop=0):
+        self.fp = fp
+        self.duration = duration
+        self.frame_count = frame_count
+        self.loop = loop
+        self.frames_written = 0
+        self.sequence = 0
+
+    def _frame_control(self, frame, offset):
+        data = struct.pack(">IIIIIHHBB", self.sequence, frame.size[0], frame.size[1], offset[0], offset[1],
+                           self.duration, 1000, APNG_DISPOSE_OP_BACKGROUND, APNG_BLEND_OP_SOURCE)
+        self.sequence += 1
+        return _png_chunk(b"fcTL", data)
+
+    def write(self, frame, window=None):
+        if self.frames_written == 0:
+            # The first frame doubles as the default image, so it has to cover the whole canvas
+            self.fp.write(PNG_SIGNATURE)
+            for chunk_type, data in _png_chunks(frame):
+                if chunk_type == b"IHDR":
+                    self.fp.write(_png_chunk(b"IHDR", data))
+                    self.fp.write(_png_chunk(b"acTL", struct.pack(">II", self.frame_count, self.loop)))
+                    self.fp.write(self._frame_control(frame, (0, 0)))
+                elif chunk_type == b"IDAT":
+                    self.fp.write(_png_chunk(b"IDAT", data))
+        else:
+            bbox = get_opaque_bbox(frame, window)
+            frame = frame.crop(bbox)
+            self.fp.write(self._frame_control(frame, bbox[:2]))
+            for chunk_type, data in _png_chunks(frame):
+                if chunk_type == b"IDAT":
+                    self.fp.write(_png_chunk(b"fdAT", struct.pack(">I", self.sequence) + data))
+                    self.sequence += 1
+
+        self.frames_written += 1
+
+    def close(self):
+        if self.frames_written:
+            self.fp.write(_png_chunk(b"IEND", b""))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def encode_gif(create_frames, duration, frame_count, palette=None):
+    with io.BytesIO() as image_binary:
+        with GifStreamWriter(image_binary, duration, palette=palette) as writer:
+            for frame, window in create_frames(indexed=palette is not None):
+                writer.write(frame, window)
+        return image_binary.getvalue()
+
+
+def encode_apng(create_frames, duration, frame_count, palette=None):
+    with io.BytesIO() as image_binary:
+        with ApngStreamWriter(image_binary, duration, frame_count) as writer:
+            for frame, window in create_frames(indexed=False):
+                writer.write(frame, window)
+        return image_binary.getvalue()
+
+
+def encode_webp(create_frames, duration, frame_count, palette=None):
+    # PIL's WebP encoder only takes a list, so unlike GIF and APNG every frame is held until it's done,
+    # that's what WEBP_MAX_FRAMES bounds
+    frames = [frame for frame, _ in create_frames(indexed=False)]
+    with io.BytesIO() as image_binary:
+        frames[0].save(image_binary, "WEBP", save_all=True, append_images=frames[1:], duration=duration, loop=0,
+                       lossless=True)
+        return image_binary.getvalue()
+
+
+# format: (encoder, file extension)
+ANIMATED_FORMATS = {
+    "gif": (encode_gif, "gif"),
+    "webp": (encode_webp, "webp"),
+    "apng": (encode_apng, "png"),
+}
+# About 190 MB of RGBA frames at full size, enough for a dozen patterns at 120 bpm
+WEBP_MAX_FRAMES = 256
+
+
+def get_formats(output_format, frame_count):
+    # Formats an animation of frame_count frames can be encoded in. "auto" is every one that can take it, the
+    # planner keeps the one estimated smallest.
+    if output_format == "auto":
+        return [name for name in ANIMATED_FORMATS if name != "webp" or frame_count <= WEBP_MAX_FRAMES]
+    if output_format not in ANIMATED_FORMATS:
+        raise ValueError(f"El formato '{output_format}' no es válido.")
+    if output_format == "webp" and frame_count > WEBP_MAX_FRAMES:
+        raise ValueError(f"El webp tendría {frame_count} frames y el máximo es {WEBP_MAX_FRAMES}, probá con gif.")
+    return [output_format]
+
+
+def encode_animation(create_frames, duration, frame_count, output_format="gif", palette=None):
+    # create_frames(indexed) returns a fresh iterator of (frame, window) pairs, RGBA frames or "P" frames in palette
+    # when indexed, window being the box of the frame that can have opaque pixels or None if unknown
+    # Always a concrete format here, "auto" is resolved by the planner
+    if output_format not in ANIMATED_FORMATS:
+        raise ValueError(f"El formato '{output_format}' no es válido.")
+    encoder, extension = ANIMATED_FORMATS[output_format]
+    return EncodedAnimation(output_format, extension, encoder(create_frames, duration, frame_count, palette),
+                            frame_count)
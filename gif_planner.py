@@ -0,0 +1,68 @@
+import math
+import numpy as np
+from collections import namedtuple
+
+GifPlan = namedtuple("GifPlan", ["frame_step", "frame_duration_ms", "scale", "frame_count", "estimated_bytes"])
+
+# Encoded bytes per on-screen content pixel by format and scale: the largest measured over the bench.py corpus at
+# 80-200 bpm, plus 10%. Scaled RGBA frames are Lanczos resampled, the blended edges cost APNG and WebP more.
+BYTES_PER_PIXEL = {
+    "gif": {1.0: 0.13, 0.75: 0.17, 0.5: 0.19},
+    "apng": {1.0: 0.17, 0.75: 0.59, 0.5: 0.59},
+    "webp": {1.0: 0.12, 0.75: 0.46, 0.5: 0.46},
+}
+GIF_FRAME_OVERHEAD_BYTES = 32
+GIF_HEADER_BYTES = 800
+
+# Preferred first: full resolution at the usual frame rate, then fewer frames, then smaller frames
+GIF_FRAME_DURATIONS_MS = (22, 30, 40, 50)
+GIF_SCALES = (1.0, 0.75, 0.5)
+
+
+def get_frame_step(frame_duration_ms, bpm, precision_factor):
+    # Scroll distance per frame, in 1/precision_factor pixels, keeps the scroll speed for any frame duration
+    return int(frame_duration_ms * precision_factor * (bpm / 120.0) * 0.895)
+
+
+def get_frame_offsets(scroll_width, total_width, frame_step, precision_factor):
+    return range(0, (scroll_width - total_width + 1) * precision_factor, frame_step)
+
+
+def estimate_gif_bytes(offsets, content_start, content_end, total_width, height, scale, precision_factor,
+                       output_format="gif"):
+    # Frames are cropped to their opaque region, so the encoded area is whatever part of the content is on screen.
+    # offsets is a range from get_frame_offsets.
+    x = np.arange(offsets.start, offsets.stop, offsets.step, dtype=np.int64) // precision_factor
+    visible_pixels = int(np.maximum(0, np.minimum(x + total_width, content_end) - np.maximum(x, content_start)).sum())
+
+    encoded_pixels = visible_pixels * scale * height * scale
+    return int(GIF_HEADER_BYTES + len(offsets) * GIF_FRAME_OVERHEAD_BYTES
+               + encoded_pixels * BYTES_PER_PIXEL[output_format][scale])
+
+
+def get_gif_plans(positions, tile_width, scroll_width, total_width, height, bpm, max_bytes, precision_factor=100,
+                  output_format="gif"):
+    # positions are the tiles' x in the strip, the plans are worked out before anything is rendered. Every plan
+    # estimated to fit, preferred first, the later ones are fallbacks if the encoded file still comes out too big.
+    content_start = positions[0] if len(positions) else 0
+    content_end = positions[-1] + tile_width if len(positions) else 0
+
+    plans = []
+    smallest = None
+    for scale in GIF_SCALES:
+        for frame_duration_ms in GIF_FRAME_DURATIONS_MS:
+            frame_step = get_frame_step(frame_duration_ms, bpm, precision_factor)
+            offsets = get_frame_offsets(scroll_width, total_width, frame_step, precision_factor)
+            estimated_bytes = estimate_gif_bytes(offsets, content_start, content_end, total_width, height, scale,
+                                                 precision_factor, output_format)
+            plan = GifPlan(frame_step, frame_duration_ms, scale, len(offsets), estimated_bytes)
+
+            if estimated_bytes <= max_bytes:
+                plans.append(plan)
+            if smallest is None or estimated_bytes < smallest.estimated_bytes:
+                smallest = plan
+
+    if plans:
+        return plans
+    raise ValueError(
+        f"El {output_format} pesaría unos {math.ceil(smallest.estimated_bytes / 2 ** 20)} MB, lo cual es una banda.")
@@ -1,10 +1,24 @@
 import io
 import os
-import math
+import time
 import asyncio
 import discord
 import logging
+import importlib
 from utils import *
+from typing import Literal
+from functools import lru_cache
+from render_cache import RenderCache, render_key, result_size
+from render_store import RenderStore, get_sprite_set_version
+from usage_log import UsageLog
+from cancellation import RenderCancelled
+from memory_budget import MemoryBudget
+from emoji_index import EmojiIndex
+from single_flight import SingleFlight
+from scheduler import PRIORITY_GIF, PRIORITY_PNG, PRIORITY_WARM
+from shards import RenderLanes, get_shard_id
+from metrics import Metrics
+from aiohttp import web
 from dotenv import load_dotenv
 from discord import app_commands
 from discord.ext import commands
@@ -15,143 +29,471 @@ DEV_MODE = False
 load_dotenv()
 patterns_folder_path = os.getenv("PATTERNS_FOLDER_PATH")
 trollocat_id = os.getenv("TROLLOCAT_ID")
+render_cache_max_bytes = int(os.getenv("RENDER_CACHE_MAX_BYTES", 64 * 2 ** 20))
+# Where the render store and the usage log go by default, next to the patterns folder
+data_folder_path = os.path.dirname(os.path.abspath(patterns_folder_path)) if patterns_folder_path else os.getcwd()
+# Renders kept on disk across restarts, shared by every bot process pointed at the same folder
+render_store_path = os.getenv("RENDER_STORE_PATH", os.path.join(data_folder_path, "render_store"))
+render_store_max_bytes = int(os.getenv("RENDER_STORE_MAX_BYTES", 2 ** 30))
+# Counts of normalized /pinga and /tt inputs, the most requested renders are warmed up at startup
+usage_log_path = os.getenv("USAGE_LOG_PATH", os.path.join(data_folder_path, "usage_log.jsonl"))
+cache_warm_top_n = int(os.getenv("CACHE_WARM_TOP_N", 20))
+# Animations are planned to fit in this, Discord's upload limit by default
+gif_max_bytes = int(os.getenv("GIF_MAX_BYTES", 10 * 2 ** 20))
+# Prometheus text endpoint, only listens locally and only if a port is set
+metrics_port = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
 
 if DEV_MODE:
     token = os.getenv('TOKEN_DEV')
 else:
     token = os.getenv('TOKEN_MAIN')
+# Unset lets Discord recommend how many shards to run
+shard_count = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+# Running renders across every shard, the cap renders are admitted under
+render_max_concurrent = int(os.getenv("RENDER_MAX_CONCURRENT", 2))
+# Per shard: worker processes, so the bot runs shards x RENDER_WORKERS of them, and running renders, so one busy
+# shard can't take every slot of RENDER_MAX_CONCURRENT
+render_workers = int(os.getenv("RENDER_WORKERS", 2))
+render_max_concurrent_per_shard = int(os.getenv("RENDER_MAX_CONCURRENT_PER_SHARD",
+                                                min(render_workers, render_max_concurrent)))
+# Renders still running this long after the command are cancelled, well inside Discord's 15 minute follow-up window
+render_deadline_s = float(os.getenv("RENDER_DEADLINE_S", 300))
+# Estimated peak memory of all running renders, across every shard, renders wait for room instead of going over
+render_memory_budget_bytes = int(os.getenv("RENDER_MEMORY_BUDGET_BYTES", 2 ** 30))
+
+# Rendering runs in worker processes so long GIFs don't block the gateway heartbeat, each shard has its own pool.
+# Each worker decodes the sprite atlas once when it starts.
+# Renders are capped overall and per shard, queued per user and served round-robin with PNGs ahead of GIFs.
+render_lanes = RenderLanes(patterns_folder_path, render_workers, render_max_concurrent_per_shard,
+                           render_max_concurrent)
+memory_budget = MemoryBudget(render_memory_budget_bytes)
+# Discord's limit of attachments per message
+max_files_per_message = 10
+render_cache = RenderCache(render_cache_max_bytes)
+# Opened by setup(), hashing the sprites and scanning the folder is disk work the gateway connection shouldn't wait on
+render_store = None
+# Loaded by warm_render_cache(), records made before that are buffered
+usage_log = UsageLog(usage_log_path)
+# Identical /pinga requests arriving while one is still rendering wait for that render instead of starting another
+render_flights = SingleFlight()
+# /tt looks emojis up by name, kept current from the gateway events instead of scanning client.emojis
+emoji_index = EmojiIndex()
+metrics = Metrics()
+# Background cache warming started by setup(), kept referenced so it isn't garbage collected mid-run
+warm_task = None
+# channel id -> /pinga tasks answering in it, cancelled if the channel goes away
+channel_tasks = {}
 
 intents = discord.Intents.default()
 intents.message_content = True
-client = commands.Bot(command_prefix='!', intents=intents)
+client = commands.AutoShardedBot(command_prefix='!', intents=intents, shard_count=shard_count)
+
+
+async def serve_metrics(request):
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server():
+    if metrics_port is None:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", serve_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, "127.0.0.1", metrics_port).start()
+    except OSError:
+        # Another process already has the port, the bot runs without the endpoint, /metricas still works
+        logging.exception(f"No se pudo abrir el puerto de métricas {metrics_port}.")
+        await runner.cleanup()
+
+
+# NumPy, PIL and the renderer are only needed to render, so they're imported in a background thread while the
+# gateway connects instead of before it. Commands that run first import them on the spot, waiting on the same
+# import lock, that's why the render functions are imported inside the functions using them.
+RENDER_MODULES = ("numpy", "PIL.Image", "sprites", "pattern_ir", "render")
+
+
+@lru_cache(maxsize=None)
+def get_pattern_ids():
+    # Pattern name -> tile id, the same ids the workers' atlases use, so only small integer arrays cross to the pool
+    from sprites import list_pattern_names
+    return {name: tile_id for tile_id, name in enumerate(list_pattern_names(patterns_folder_path))}
+
+
+def preload_render_modules():
+    try:
+        with metrics.time("startup", "import"):
+            for name in RENDER_MODULES:
+                importlib.import_module(name)
+            get_pattern_ids()
+    except Exception:
+        logging.exception("No se pudieron cargar los módulos de render.")
+
+
+async def warm_render_cache():
+    # Renders the most requested /pinga inputs one at a time, below every user render, so they're cached
+    # (or loaded back from the render store) before anyone asks. /tt has nothing to render, it's only counted.
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, usage_log.load)
+    except OSError:
+        logging.exception("No se pudo cargar el registro de uso.")
+    await loop.run_in_executor(None, usage_log.flush)
+    await loop.run_in_executor(None, preload_render_modules)
+    from pattern_ir import encode_patterns
+
+    lane = render_lanes.get(0)
+    for key in usage_log.most_common("pinga", cache_warm_top_n):
+        if key in render_cache:
+            continue
+
+        text, gif, bpm, formato = key
+        try:
+            ir = encode_patterns(get_patterns_from_text(text), get_pattern_ids())
+            deadline = time.time() + render_deadline_s
+            await render_flights.run(key, lambda: render_pinga(key, lane, None, ir, gif, bpm or 120.0,
+                                                               formato or "gif", deadline, PRIORITY_WARM))
+        except (ValueError, RenderCancelled):
+            continue
+        except Exception:
+            logging.exception(f"No se pudo precalentar '{text}'.")
+
+        metrics.inc("warmed_total", "pinga")
+
+
+def open_render_store():
+    return RenderStore(render_store_path, render_store_max_bytes, get_sprite_set_version(patterns_folder_path))
+
+
+async def setup():
+    global render_store, warm_task
+    await start_metrics_server()
+    # Without a patterns folder there's nothing to render, the bot still starts and fails on first use like before
+    if patterns_folder_path:
+        render_store = await asyncio.get_running_loop().run_in_executor(None, open_render_store)
+    # Not awaited, the gateway connection doesn't wait for it
+    warm_task = asyncio.create_task(warm_render_cache())
+
+
+client.setup_hook = setup
 
 logging.basicConfig(level=logging.INFO)
 
 
 @client.event
 async def on_ready():
+    emoji_index.rebuild(client.emojis)
     print(f'Loggeado como {client.user}')
 
 
+@client.event
+async def on_guild_emojis_update(guild, before, after):
+    emoji_index.remove(before)
+    emoji_index.add(after)
+
+
+@client.event
+async def on_guild_join(guild):
+    emoji_index.add(guild.emojis)
+
+
+@client.event
+async def on_guild_remove(guild):
+    emoji_index.remove(guild.emojis)
+    for channel in guild.channels:
+        cancel_channel_tasks(channel.id)
+
+
+@client.event
+async def on_guild_channel_delete(channel):
+    cancel_channel_tasks(channel.id)
+
+
+@client.event
+async def on_thread_delete(thread):
+    cancel_channel_tasks(thread.id)
+
+
+def record_usage(command, key):
+    usage_log.record(command, key)
+    # Not awaited, the reply doesn't wait for the disk
+    asyncio.get_running_loop().run_in_executor(None, usage_log.flush)
+
+
+def cancel_channel_tasks(channel_id):
+    # Nowhere left to send the result. Renders nobody else is waiting on are cancelled with them.
+    for task in channel_tasks.pop(channel_id, ()):
+        task.cancel()
+
+
 @client.hybrid_command()
 async def sync(ctx: commands.Context):
     await ctx.send("Slash commands sincronizados")
     await client.tree.sync()
 
 
-@client.tree.command(name="pinga", description="Genera una imagen o GIF a partir de un patrón.")
-@app_commands.describe(texto="Patrón en texto.", gif="¿Visualizar animado en GIF? por defecto: False.",
-                       bpm="Velocidad del GIF, por defecto: 120.")
-async def pinga(interaction: discord.Interaction, texto: str, gif: bool = False, bpm: float = 120.0):
+async def render_png(lane, ir, deadline):
+    from render import render_png_chunk, split_png_chunks
+
+    # Every 16 tile chunk is its own job, so the chunks are encoded in parallel across the pool
+    jobs = [lane.cancel_board.run(lane.pool, deadline, render_png_chunk, chunk) for chunk in split_png_chunks(ir)]
+
+    chunks = []
+    timings = {}  # summed over the chunks, i.e. worker CPU time per stage
+    for png_bytes, chunk_timings in await asyncio.gather(*jobs):
+        chunks.append(png_bytes)
+        for stage, seconds in chunk_timings.items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    return chunks, timings
+
+
+async def render_pinga(key, lane, user_id, ir, gif, bpm, formato, deadline, priority=None):
+    from render import estimate_render_bytes, render_animation
+
+    # GIFs are planned to fit gif_max_bytes, so a different limit is a different render
+    store_key = (*key, gif_max_bytes if gif else None)
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, render_store.get, store_key) if render_store else None
+    if result is not None:
+        render_cache.put(key, result)
+        return result
+
+    # Estimated from the same plan the worker will use, so a render that can't fit fails here already
+    size = estimate_render_bytes(ir, gif, bpm, formato, gif_max_bytes)
+    if priority is None:
+        priority = PRIORITY_GIF if gif else PRIORITY_PNG
+    # Memory first, so a render waiting for room doesn't hold a lane slot the renders queued behind it could use
+    async with memory_budget.reserve(size, priority):
+        if gif:
+            result, timings = await lane.scheduler.run(user_id, priority, lambda: lane.cancel_board.run(
+                lane.pool, deadline, render_animation, ir, bpm, formato, gif_max_bytes))
+        else:
+            result, timings = await lane.scheduler.run(user_id, priority, lambda: render_png(lane, ir, deadline))
+
+    metrics.observe_all("pinga", timings)
+    if result:
+        metrics.inc("frames_total", "pinga", result.frame_count if gif else len(result))
+        metrics.inc("output_bytes_total", "pinga", result_size(result))
+
+    render_cache.put(key, result)
+    # Not awaited, the upload doesn't wait for the disk
+    if render_store:
+        loop.run_in_executor(None, render_store.put, store_key, result)
+    return result
+
+
+async def render_preview(lane, user_id, ir, deadline):
+    from render import CHUNK_SIZE, estimate_render_bytes, render_png_chunk
+    from pattern_ir import slice_ir
+
+    # The first chunk of the PNG montage, queued like a PNG render so it goes ahead of the GIF it previews
+    chunk = slice_ir(ir, 0, CHUNK_SIZE)
+    async with memory_budget.reserve(estimate_render_bytes(chunk, False, None), PRIORITY_PNG):
+        png_bytes, timings = await lane.scheduler.run(user_id, PRIORITY_PNG, lambda: lane.cancel_board.run(
+            lane.pool, deadline, render_png_chunk, chunk))
+    metrics.observe_all("preview", timings)
+    return png_bytes
+
+
+async def send_preview(interaction, lane, ir, deadline, rendering, formato):
+    # Shows a still of the first tiles if it's ready before the animation, returns whether it did
+    preview = asyncio.ensure_future(render_preview(lane, interaction.user.id, ir, deadline))
+    # The render may be someone else's with an earlier deadline, once it's over, failed or not, the preview is moot
+    rendering.add_done_callback(lambda _: preview.cancel())
     try:
-        patterns = get_patterns_from_text(texto)
-    except ValueError as ve:
-        await interaction.response.send_message(f"Error. {ve}", ephemeral=True)
+        await asyncio.wait({preview, rendering}, return_when=asyncio.FIRST_COMPLETED)
+        if rendering.done() or preview.exception() is not None:
+            return False
+
+        with metrics.time("pinga", "preview"):
+            await interaction.edit_original_response(
+                content=f"Vista previa, el {formato.upper()} está en camino.",
+                attachments=[discord.File(fp=io.BytesIO(preview.result()), filename='trollobot_taiko_preview.png')])
+        metrics.inc("previews_total", "pinga")
+        return True
+    finally:
+        # Not needed anymore if the animation won the race
+        preview.cancel()
+
+
+async def send_text(interaction, previewed, content):
+    # Once a preview was sent, the message is replaced rather than leaving it promising an animation that won't come
+    if previewed:
+        await interaction.edit_original_response(content=content, attachments=[])
     else:
+        await interaction.followup.send(content)
+
+
+@client.tree.command(name="pinga", description="Genera una imagen o GIF a partir de un patrón.")
+@app_commands.describe(texto="Patrón en texto.", gif="¿Visualizar animado en GIF? por defecto: False.",
+                       bpm="Velocidad del GIF, por defecto: 120.",
+                       formato="Formato animado, por defecto: gif. auto elige el archivo más liviano.")
+async def pinga(interaction: discord.Interaction, texto: str, gif: bool = False, bpm: float = 120.0,
+                formato: Literal["auto", "gif", "webp", "apng"] = "gif"):
+    metrics.inc("requests_total", "pinga")
+
+    # Repeated requests skip parsing, compositing and encoding. "auto" is only known once planned, its renders are
+    # cached under the format it picks, so they're shared with requests for that format.
+    key = render_key(texto, gif, bpm, formato)
+    result = None if key[3] == "auto" else render_cache.get(key)
+
+    if result is None:
+        from pattern_ir import encode_patterns
+
         try:
-            await interaction.response.defer()  # Defer the response to avoid timeout
-
-            image_paths = [f"{patterns_folder_path}/{pattern[0]}.png" for pattern in patterns]
-
-            chunk_size = 16
-            image_limit = 8
-
-            # GIF
-            if gif:
-                images = [Image.open(path) for path in image_paths]
-
-                frame_duration_ms = 22
-                precision_factor = 100
-                # total_width = 2016
-                total_width = 1512
-                max_height = 124
-
-                total_scroll_width = total_width * 2 + sum(img.size[0] for img in images)
-
-                frames = []
-                for offset in range(0, (total_scroll_width - total_width + 1) * precision_factor,
-                                    int(frame_duration_ms * precision_factor * (bpm / 120.0) * 0.895)):
-                    frame = Image.new("RGBA", (total_width, max_height), (255, 255, 255, 0))
-                    x_offset = total_width * precision_factor - offset
-                    for index, img in enumerate(images):
-                        if x_offset + img.size[0] * precision_factor > 0 and x_offset < total_width * precision_factor:
-                            frame.paste(img, (int(x_offset / precision_factor), 0), img)
-                        x_offset += img.size[0] * precision_factor
-                        x_offset = int(x_offset - max_height * patterns[index][1] * precision_factor)
-
-                    frames.append(frame)
-
-                    if len(frames) > 1200:
-                        raise ValueError(
-                            f"El gif duraría más de {int(round(len(frames) * frame_duration_ms / 1000, 0))} segundos, lo cual es una banda.")
-
-                if frames:
-                    with io.BytesIO() as image_binary:
-                        frames[0].save(image_binary, format='GIF', save_all=True, disposal=2, append_images=frames[1:],
-                                       duration=frame_duration_ms, loop=0)
-                        image_binary.seek(0)
-
-                        await interaction.followup.send(
-                            file=discord.File(fp=image_binary, filename='trollobot_taiko_patterns.gif'))
-                else:
-                    await interaction.followup.send("No hay frames para crear el GIF.")
-
-            # PNG
+            with metrics.time("pinga", "parse"):
+                ir = encode_patterns(get_patterns_from_text(texto), get_pattern_ids())
+            if key[3] == "auto":
+                from render import choose_animation_format
+                formato = await asyncio.get_running_loop().run_in_executor(
+                    None, choose_animation_format, ir, bpm, formato, gif_max_bytes)
+                key = render_key(texto, gif, bpm, formato)
+                result = render_cache.get(key)
+        except ValueError as ve:
+            await interaction.response.send_message(f"Error. {ve}", ephemeral=True)
+            return
+
+    record_usage("pinga", key)
+
+    task = asyncio.current_task()
+    channel_tasks.setdefault(interaction.channel_id, set()).add(task)
+
+    previewed = False
+    try:
+        await interaction.response.defer()  # Defer the response to avoid timeout
+
+        if result is None:
+            lane = render_lanes.get(get_shard_id(interaction.guild_id, client.shard_count))
+            deadline = interaction.created_at.timestamp() + render_deadline_s
+            rendering = asyncio.ensure_future(render_flights.run(
+                key, lambda: render_pinga(key, lane, interaction.user.id, ir, gif, bpm, formato, deadline)))
+            try:
+                if gif and len(ir.tile_ids):
+                    previewed = await send_preview(interaction, lane, ir, deadline, rendering, formato)
+                result = await rendering
+            finally:
+                rendering.cancel()  # only does something if this task was cancelled while waiting
+
+        # GIF
+        if gif:
+            if result:
+                with io.BytesIO(result.data) as image_binary, metrics.time("pinga", "upload"):
+                    file = discord.File(fp=image_binary, filename=f'trollobot_taiko_patterns.{result.extension}')
+                    if previewed:
+                        # Replaces the preview in the same message
+                        await interaction.edit_original_response(content=None, attachments=[file])
+                    else:
+                        await interaction.followup.send(file=file)
             else:
-                if len(image_paths) > chunk_size * image_limit:
-                    raise ValueError(
-                        f"El resultado daría {math.ceil(len(image_paths) / chunk_size)} imágenes, lo cual es una banda.")
+                await send_text(interaction, previewed, "No hay frames para crear el GIF.")
 
-                for i in range(0, len(image_paths), chunk_size):
-                    chunk = image_paths[i:i + chunk_size]
-                    montage = create_beatmap_image(chunk)
+        # PNG
+        else:
+            files = [discord.File(fp=io.BytesIO(png_bytes), filename=f'trollobot_taiko_pattern{i + 1}.png')
+                     for i, png_bytes in enumerate(result)]
 
-                    with io.BytesIO() as image_binary:
-                        montage.save(image_binary, 'PNG')
-                        image_binary.seek(0)
+            # As many attachments per message as Discord allows, usually a single upload
+            with metrics.time("pinga", "upload"):
+                for i in range(0, len(files), max_files_per_message):
+                    await interaction.followup.send(files=files[i:i + max_files_per_message])
 
-                        # First interaction
-                        if i == 0:
-                            await interaction.followup.send(
-                                file=discord.File(fp=image_binary,
-                                                  filename=f'trollobot_taiko_pattern{i // chunk_size + 1}.png'))
-                        else:
-                            await interaction.channel.send(
-                                file=discord.File(fp=image_binary,
-                                                  filename=f'trollobot_taiko_pattern{i // chunk_size + 1}.png'))
 
+    except (ValueError, RenderCancelled) as ve:
 
-        except ValueError as ve:
+        await send_text(interaction, previewed, f"Error. {ve}")
 
-            await interaction.followup.send(f"Error. {ve}")
 
+    except Exception as e:
 
-        except Exception as e:
+        await send_text(interaction, previewed, f"Error inesperado. {e}")
+
+    finally:
+        tasks = channel_tasks.get(interaction.channel_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del channel_tasks[interaction.channel_id]
+
+
+async def is_trollocat(ctx: commands.Context):
+    if str(ctx.author.id) != trollocat_id:
+        await ctx.send("Este comando es solo para trollocat.", ephemeral=True)
+        return False
+    return True
+
+
+@client.hybrid_command()
+async def cache(ctx: commands.Context):
+    if not await is_trollocat(ctx):
+        return
 
-            await interaction.followup.send(f"Error inesperado. {e}")
+    stats = render_cache.stats()
+    message = (f"Caché: {stats['entries']} entradas, {stats['bytes'] / 2 ** 20:.1f}/{stats['max_bytes'] / 2 ** 20:.1f} MB, "
+               f"{stats['hits']} aciertos, {stats['misses']} fallos ({stats['hit_rate']:.0%}).")
+    if render_store:
+        store_stats = render_store.stats()
+        message += (f"\nDisco: {store_stats['bytes'] / 2 ** 20:.1f}/{store_stats['max_bytes'] / 2 ** 20:.1f} MB, "
+                    f"{store_stats['hits']} aciertos, {store_stats['misses']} fallos ({store_stats['hit_rate']:.0%}).")
+    await ctx.send(message)
+
+
+@client.hybrid_command()
+async def cola(ctx: commands.Context):
+    if not await is_trollocat(ctx):
+        return
+
+    lines = [f"Shard {shard_id}: {stats['running']}/{stats['max_concurrent']} renders en curso, "
+             f"{stats['queued_png']} PNG y {stats['queued_gif']} GIF en cola. "
+             f"Espera: media {stats['wait_mean_s']:.2f}s, p95 {stats['wait_p95_s']:.2f}s, máx {stats['wait_max_s']:.2f}s."
+             for shard_id, stats in render_lanes.stats().items()]
+    total = render_lanes.limit.stats()
+    lines.append(f"Total: {total['running']}/{total['max_concurrent']} renders en curso.")
+    budget = memory_budget.stats()
+    lines.append(f"Memoria: {budget['used_bytes'] / 2 ** 20:.0f}/{budget['max_bytes'] / 2 ** 20:.0f} MB estimados "
+                 f"en {budget['running']} renders, {budget['waiting']} esperando lugar.")
+    await ctx.send("\n".join(lines))
+
+
+@client.hybrid_command()
+async def metricas(ctx: commands.Context):
+    if not await is_trollocat(ctx):
+        return
+
+    await ctx.send(f"```\n{metrics.summary() or 'Sin datos todavía.'}\n```")
 
 
 @client.tree.command(name="tt", description="Genera un mensaje con emojis a partir de un patrón.")
 async def tt(interaction: discord.Interaction, texto: str):
+    metrics.inc("requests_total", "tt")
+
     try:
-        patterns = get_patterns_from_text(texto)
+        with metrics.time("tt", "parse"):
+            patterns = get_patterns_from_text(texto)
     except ValueError as ve:
         await interaction.response.send_message(f"Error. {ve}", ephemeral=True)
     else:
+        record_usage("tt", (texto.lower(),))
+
         try:
-            result = ""
-            for emote in patterns:
-                emoji = discord.utils.get(client.emojis, name=emote[0])
-                if emoji:
-                    result += str(emoji)
-                else:
-                    result += f":{emote}:"
-            result += "​"  # Invisible zero width character
+            with metrics.time("tt", "asset_load"):
+                result = ""
+                for emote in patterns:
+                    emoji = emoji_index.get(emote[0])
+                    if emoji:
+                        result += str(emoji)
+                    else:
+                        result += f":{emote}:"
+                result += "​"  # Invisible zero width character
 
             if len(result) > 1500:
                 raise ValueError("El mensaje se pasa del límite de 1500 caracteres de Discord.")
 
-            await interaction.response.send_message(result)
+            metrics.inc("output_bytes_total", "tt", len(result.encode()))
+            with metrics.time("tt", "upload"):
+                await interaction.response.send_message(result)
 
         except ValueError as ve:
             await interaction.response.send_message(f"Error. {ve}", ephemeral=True)
@@ -160,4 +502,5 @@ async def tt(interaction: discord.Interaction, texto: str):
             await interaction.response.send_message(f"Error inesperado. {e}", ephemeral=True)
 
 
-client.run(token)
+if __name__ == "__main__":
+    client.run(token)
@@ -0,0 +1,70 @@
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+
+class MemoryBudget:
+    # Byte-counting semaphore shared by every render lane: a render only starts once its estimated peak memory
+    # fits in what the running ones left. Waiters are served by priority, then in order, so a big render isn't
+    # starved by small ones of its own priority but doesn't hold up cheaper, more urgent ones either.
+    # A render bigger than the whole budget still runs, alone.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.running = 0
+        # Heap of (priority, arrival, future, bytes)
+        self.waiters = []
+        self.arrivals = itertools.count()
+
+    @asynccontextmanager
+    async def reserve(self, size, priority=0):
+        size = min(size, self.max_bytes)
+        await self._acquire(size, priority)
+        try:
+            yield
+        finally:
+            self._release(size)
+
+    async def _acquire(self, size, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.arrivals), future, size))
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(size)
+            else:
+                # _dispatch drops the cancelled entry, it may have been what the ones behind it were waiting on
+                self._dispatch()
+            raise
+
+    def _release(self, size):
+        self.used_bytes -= size
+        self.running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.waiters:
+            _, _, future, size = self.waiters[0]
+            if future.done():
+                heapq.heappop(self.waiters)
+                continue
+            if self.used_bytes + size > self.max_bytes:
+                return
+
+            heapq.heappop(self.waiters)
+            self.used_bytes += size
+            self.running += 1
+            future.set_result(None)
+
+    def stats(self):
+        return {
+            "used_bytes": self.used_bytes,
+            "max_bytes": self.max_bytes,
+            "running": self.running,
+            "waiting": sum(not future.done() for _, _, future, _ in self.waiters),
+        }
@@ -0,0 +1,97 @@
+import time
+import bisect
+from contextlib import contextmanager
+
+# Seconds, roughly x2.5 apart from 1 ms to 30 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@contextmanager
+def timed(timings, stage):
+    # Adds the time spent in the block to timings[stage], timings is a plain dict so it can cross process boundaries
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket the quantile falls in, good enough for a summary
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    def __init__(self, prefix="trollobot"):
+        self.prefix = prefix
+        # (command, stage) -> Histogram
+        self.stages = {}
+        # (name, command) -> value
+        self.counters = {}
+
+    def observe(self, command, stage, seconds):
+        self.stages.setdefault((command, stage), Histogram()).observe(seconds)
+
+    def observe_all(self, command, timings):
+        for stage, seconds in timings.items():
+            self.observe(command, stage, seconds)
+
+    def inc(self, name, command, value=1):
+        self.counters[(name, command)] = self.counters.get((name, command), 0) + value
+
+    @contextmanager
+    def time(self, command, stage):
+        timings = {}
+        with timed(timings, stage):
+            yield
+        self.observe_all(command, timings)
+
+    def render_prometheus(self):
+        name = f"{self.prefix}_stage_seconds"
+        lines = [f"# HELP {name} Time spent in each stage of a command.", f"# TYPE {name} histogram"]
+        for (command, stage), histogram in sorted(self.stages.items()):
+            labels = f'command="{command}",stage="{stage}"'
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        for counter in sorted({counter for counter, _ in self.counters}):
+            lines.append(f"# TYPE {self.prefix}_{counter} counter")
+            for (name, command), value in sorted(self.counters.items()):
+                if name == counter:
+                    lines.append(f'{self.prefix}_{counter}{{command="{command}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        lines = []
+        for (command, stage), histogram in sorted(self.stages.items()):
+            lines.append(f"{command}/{stage}: {histogram.count}x, media {histogram.sum / histogram.count * 1000:.1f} ms, "
+                         f"p95 ≤ {histogram.quantile(0.95) * 1000:.0f} ms")
+        for (name, command), value in sorted(self.counters.items()):
+            lines.append(f"{command}/{name}: {value}")
+        return "\n".join(lines)
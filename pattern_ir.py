@@ -0,0 +1,33 @@
+import numpy as np
+from collections import namedtuple
+
+# tile_ids index into SpriteAtlas.names, overlaps are the fraction of a tile height the next tile is pulled back by
+PatternIR = namedtuple("PatternIR", ["tile_ids", "overlaps"])
+
+
+def encode_patterns(patterns, tile_ids):
+    # patterns is get_patterns_from_text's output, tile_ids maps pattern names to ids
+    try:
+        ids = np.fromiter((tile_ids[name] for name, _ in patterns), dtype=np.uint16, count=len(patterns))
+    except KeyError as e:
+        raise ValueError(f"No existe el patrón '{e.args[0]}'.") from None
+    overlaps = np.fromiter((overlap for _, overlap in patterns), dtype=np.float64, count=len(patterns))
+    return PatternIR(ids, overlaps)
+
+
+def slice_ir(ir, start, stop):
+    return PatternIR(ir.tile_ids[start:stop], ir.overlaps[start:stop])
+
+
+def layout_row(ir, widths, start):
+    # Tiles side by side, overlaps ignored, as in the PNG montage
+    advances = widths[ir.tile_ids]
+    return (start + np.cumsum(advances) - advances).astype(np.int64)
+
+
+def layout_tiles(ir, widths, start, max_height, precision_factor=100):
+    # x of every tile: a cumulative sum of each tile's width minus its overlap with the next one,
+    # in 1/precision_factor pixel steps like the old per-tile loop
+    advances = np.floor(widths[ir.tile_ids] * precision_factor - max_height * ir.overlaps * precision_factor)
+    x_offsets = start * precision_factor + np.cumsum(advances) - advances
+    return (x_offsets // precision_factor).astype(np.int64)
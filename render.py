@@ -0,0 +1,279 @@
+import io
+import math
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from sprites import TILE_SIZE, SpriteAtlas
+from encoders import GIF_TRANSPARENT_INDEX, encode_animation, get_formats
+from metrics import timed
+from cancellation import check_cancelled
+from gif_planner import get_frame_offsets, get_frame_step, get_gif_plans
+from pattern_ir import layout_row, layout_tiles, slice_ir
+from utils import BEATMAP_MARGIN, create_beatmap_image
+
+CHUNK_SIZE = 16
+IMAGE_LIMIT = 8
+
+GIF_FRAME_DURATION_MS = 22
+# Same playback length the old 1200 frame cap allowed
+GIF_MAX_DURATION_S = 1200 * GIF_FRAME_DURATION_MS / 1000
+# Discord's upload limit without boosts
+GIF_MAX_BYTES = 10 * 2 ** 20
+# total_width = 2016
+GIF_WIDTH = 1512
+GIF_HEIGHT = 124
+# Pixels a scaled down tile can spread past its edges, Lanczos reaches 3 pixels out plus rounding
+RESIZE_PADDING = 4
+
+# For estimate_render_bytes: a PNG chunk's canvas, its blending temporaries and the encoded PNG,
+# and the frame being encoded with its crops and quantized copies, in bytes per frame pixel
+PNG_CHUNK_PEAK_BYTES = 4 * 2 ** 20
+FRAME_WORKING_BYTES_PER_PIXEL = 16
+
+# Each worker process decodes its own copy of the sprites once, in init_worker
+_atlas = None
+# The pool's CancelBoard flags, renders given a token check them between frames and chunks
+_cancel_flags = None
+
+
+def init_worker(patterns_folder_path, cancel_flags=None):
+    global _atlas, _cancel_flags
+    _atlas = SpriteAtlas(patterns_folder_path)
+    _cancel_flags = cancel_flags
+
+
+def create_render_pool(patterns_folder_path, workers, cancel_flags=None):
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                               initargs=(patterns_folder_path, cancel_flags))
+
+
+def split_png_chunks(ir):
+    tile_count = len(ir.tile_ids)
+    if tile_count > CHUNK_SIZE * IMAGE_LIMIT:
+        raise ValueError(
+            f"El resultado daría {math.ceil(tile_count / CHUNK_SIZE)} imágenes, lo cual es una banda.")
+
+    return [slice_ir(ir, i, i + CHUNK_SIZE) for i in range(0, tile_count, CHUNK_SIZE)]
+
+
+# Worker entry points take a PatternIR and return (result, timings),
+# timings being seconds per stage for the metrics in the bot process.
+# With a token they raise RenderCancelled as soon as the render is cancelled or past its deadline.
+
+def render_png_chunk(ir, token=None):
+    check_cancelled(_cancel_flags, token)
+    timings = {}
+
+    with timed(timings, "asset_load"):
+        tiles = _atlas.get_tile_arrays(ir.tile_ids)
+    with timed(timings, "composite"):
+        montage = create_beatmap_image(tiles, layout_row(ir, _atlas.widths, BEATMAP_MARGIN))
+
+    check_cancelled(_cancel_flags, token)
+
+    with timed(timings, "encode"), io.BytesIO() as image_binary:
+        montage.save(image_binary, 'PNG')
+        png_bytes = image_binary.getvalue()
+
+    return png_bytes, timings
+
+
+def render_png_chunks(ir):
+    return [render_png_chunk(chunk)[0] for chunk in split_png_chunks(ir)]
+
+
+def get_strip_positions(ir, widths, total_width, max_height, precision_factor):
+    # Blank margin of one frame on each side, so the animation scrolls in from the right and out to the left
+    total_scroll_width = total_width * 2 + int(widths[ir.tile_ids].sum())
+
+    return total_scroll_width, layout_tiles(ir, widths, total_width, max_height, precision_factor)
+
+
+def create_scroll_strip(tiles, positions, scroll_width, max_height):
+    strip = Image.new("RGBA", (scroll_width, max_height), (255, 255, 255, 0))
+
+    for img, x in zip(tiles, positions.tolist()):
+        strip.paste(img, (x, 0), img)
+
+    return strip
+
+
+def create_indexed_scroll_strip(indexed_tiles, positions, scroll_width, max_height):
+    # Same strip built straight in the atlas palette, overlapping tiles replace each other's opaque pixels
+    strip = Image.new("P", (scroll_width, max_height), GIF_TRANSPARENT_INDEX)
+    strip.putpalette(_atlas.palette)
+
+    for (img, mask), x in zip(indexed_tiles, positions.tolist()):
+        strip.paste(img, (x, 0), mask)
+
+    return strip
+
+
+def get_visible_span(starts, ends, left, right):
+    # starts are sorted and ends are a running maximum, so the tiles overlapping [left, right) are the contiguous
+    # range found by two binary searches, whatever the length of the pattern
+    first = np.searchsorted(ends, left, "right")
+    last = np.searchsorted(starts, right, "left")
+    if first >= last:
+        return None
+    return max(starts[first], left), min(ends[last - 1], right)
+
+
+def plan_animation(ir, widths, bpm, output_format, max_bytes, precision_factor):
+    # Layout, resolved format and the GifPlans estimated to fit, best first, plans is empty when there are no frames
+    total_width = GIF_WIDTH
+    max_height = GIF_HEIGHT
+
+    scroll_width, positions = get_strip_positions(ir, widths, total_width, max_height, precision_factor)
+
+    # Frames are streamed to the encoder, so the limit is on playback time rather than memory
+    offsets = get_frame_offsets(scroll_width, total_width, get_frame_step(GIF_FRAME_DURATION_MS, bpm, precision_factor),
+                                precision_factor)
+    duration_s = len(offsets) * GIF_FRAME_DURATION_MS / 1000
+    if duration_s > GIF_MAX_DURATION_S:
+        raise ValueError(f"El gif duraría {int(round(duration_s, 0))} segundos, lo cual es una banda.")
+
+    # The most frames any plan has, the WebP frame limit is checked against it
+    formats = get_formats(output_format, len(offsets))
+    if not offsets:
+        return scroll_width, positions, formats[0], []
+
+    # Frame rate and size are chosen up front so the upload fits, instead of finding out after encoding
+    last_width = int(widths[ir.tile_ids[-1]]) if len(ir.tile_ids) else 0
+    candidates = []
+    errors = []
+    for name in formats:
+        try:
+            candidates.append((name, get_gif_plans(positions, last_width, scroll_width, total_width, max_height, bpm,
+                                                   max_bytes, precision_factor, name)))
+        except ValueError as e:
+            errors.append(e)
+    if not candidates:
+        raise errors[0]
+
+    # For "auto": the format that fits the best plan, full size and frame rate first, the smallest file among those
+    output_format, plans = min(candidates, key=lambda candidate: (-candidate[1][0].scale,
+                                                                  candidate[1][0].frame_duration_ms,
+                                                                  candidate[1][0].estimated_bytes))
+    return scroll_width, positions, output_format, plans
+
+
+def get_planning_widths(ir):
+    # Every tile is TILE_SIZE wide as SpriteAtlas makes sure of, so plans can be made without loading the atlas
+    return np.full(int(ir.tile_ids.max()) + 1 if len(ir.tile_ids) else 0, TILE_SIZE[0])
+
+
+def choose_animation_format(ir, bpm, output_format="auto", max_bytes=GIF_MAX_BYTES):
+    # The concrete format a render of output_format ends up as, so "auto" shares renders with what it picks
+    return plan_animation(ir, get_planning_widths(ir), bpm, output_format, max_bytes, 100)[2]
+
+
+def estimate_render_bytes(ir, gif, bpm, output_format="gif", max_bytes=GIF_MAX_BYTES):
+    # Peak memory a render takes in its worker, on top of the worker's atlas. Worked out from the same layout and
+    # plan the render uses.
+    if not gif:
+        return math.ceil(len(ir.tile_ids) / CHUNK_SIZE) * PNG_CHUNK_PEAK_BYTES
+
+    scroll_width, _, output_format, plans = plan_animation(ir, get_planning_widths(ir), bpm, output_format, max_bytes,
+                                                           100)
+    if not plans:
+        return 0
+
+    # The fallback plans are smaller, the first one is the peak
+    plan = plans[0]
+    frame_pixels = round(GIF_WIDTH * plan.scale) * round(GIF_HEIGHT * plan.scale)
+    # The strip before and after scaling, both alive while it's resized
+    strip_pixels = scroll_width * GIF_HEIGHT
+    if plan.scale != 1:
+        strip_pixels += round(scroll_width * plan.scale) * round(GIF_HEIGHT * plan.scale)
+
+    if output_format == "gif":
+        total = strip_pixels  # one byte per pixel in the atlas palette
+    else:
+        total = strip_pixels * 4
+    if output_format == "webp":
+        total += plan.frame_count * frame_pixels * 4  # every RGBA frame is held until the encoder is done
+    total += frame_pixels * FRAME_WORKING_BYTES_PER_PIXEL
+    # The encoder's output, in its buffer and copied out of it
+    total += 2 * plan.estimated_bytes
+    return total
+
+
+def encode_plan(ir, scroll_width, positions, plan, output_format, timings, token=None, precision_factor=100):
+    total_width = GIF_WIDTH
+    max_height = GIF_HEIGHT
+
+    offsets = get_frame_offsets(scroll_width, total_width, plan.frame_step, precision_factor)
+    frame_width = round(total_width * plan.scale)
+    frame_height = round(max_height * plan.scale)
+
+    # The animation is a plain horizontal scroll, so each strip is composited once and every frame is a crop of it
+    strips = {}
+    starts = positions
+    ends = np.maximum.accumulate(positions + _atlas.widths[ir.tile_ids])
+    # Resampling bleeds a few pixels past a tile's edges
+    padding = 0 if plan.scale == 1 else RESIZE_PADDING
+    # The strips are built lazily from inside the encoders, don't count them twice
+    built_before = timings.get("asset_load", 0.0) + timings.get("composite", 0.0)
+
+    def create_frames(indexed):
+        if indexed not in strips:
+            with timed(timings, "asset_load"):
+                tiles = _atlas.get_indexed_tiles(ir.tile_ids) if indexed else _atlas.get_tiles(ir.tile_ids)
+
+            with timed(timings, "composite"):
+                if indexed:
+                    strip = create_indexed_scroll_strip(tiles, positions, scroll_width, max_height)
+                    resample = Image.Resampling.NEAREST
+                else:
+                    strip = create_scroll_strip(tiles, positions, scroll_width, max_height)
+                    resample = Image.Resampling.LANCZOS
+                if plan.scale != 1:
+                    strip = strip.resize((round(scroll_width * plan.scale), frame_height), resample)
+            strips[indexed] = strip
+        strip = strips[indexed]
+
+        for offset in offsets:
+            check_cancelled(_cancel_flags, token)
+            x = int(offset / precision_factor * plan.scale)
+            frame = strip.crop((x, 0, x + frame_width, frame_height))
+
+            # Only the visible tiles' columns are scanned for the encoders' opaque bounding box
+            span = get_visible_span(starts, ends, (x - padding) / plan.scale, (x + frame_width + padding) / plan.scale)
+            if span is None:
+                yield frame, (0, 0, 0, 0)
+            else:
+                left = max(0, math.floor(span[0] * plan.scale) - x - padding)
+                right = min(frame_width, math.ceil(span[1] * plan.scale) - x + padding)
+                yield frame, (left, 0, right, frame_height)
+
+    with timed(timings, "encode"):
+        animation = encode_animation(create_frames, plan.frame_duration_ms, len(offsets), output_format,
+                                     _atlas.palette)
+    timings["encode"] -= timings.get("asset_load", 0.0) + timings.get("composite", 0.0) - built_before
+
+    return animation
+
+
+def render_animation(ir, bpm, output_format="gif", max_bytes=GIF_MAX_BYTES, token=None):
+    precision_factor = 100
+
+    scroll_width, positions, output_format, plans = plan_animation(ir, _atlas.widths, bpm, output_format, max_bytes,
+                                                                   precision_factor)
+    timings = {}
+    if not plans:
+        return None, timings
+
+    # The plans' sizes are conservative estimates, one that still comes out too big falls back to the next plan
+    # that fits once the estimates are corrected by how far off this one was
+    limit = max_bytes
+    for plan in plans:
+        if plan.estimated_bytes > limit:
+            continue
+        animation = encode_plan(ir, scroll_width, positions, plan, output_format, timings, token, precision_factor)
+        if len(animation.data) <= max_bytes:
+            return animation, timings
+        limit = plan.estimated_bytes * max_bytes / len(animation.data)
+
+    raise ValueError(
+        f"El {output_format} pesaría unos {math.ceil(len(animation.data) / 2 ** 20)} MB, lo cual es una banda.")
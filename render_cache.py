@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+
+def render_key(text, gif, bpm, output_format="gif"):
+    # bpm and the output format only change the output of GIFs
+    if not gif:
+        return text.lower(), gif, None, None
+    return text.lower(), gif, float(bpm), output_format
+
+
+def result_size(result):
+    # A list of PNG chunks or an EncodedAnimation, told apart without importing the encoders
+    if isinstance(result, list):
+        return sum(len(chunk) for chunk in result)
+    return len(result.data)
+
+
+class RenderCache:
+    # LRU over the encoded outputs of /pinga, bounded by the total size of the stored bytes
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        try:
+            result, _ = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        if not result:
+            return
+
+        size = result_size(result)
+        if size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)[1]
+
+        self.entries[key] = (result, size)
+        self.total_bytes += size
+
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,139 @@
+import os
+import glob
+import json
+import hashlib
+import logging
+import tempfile
+from collections import namedtuple
+
+# Same fields as encoders.EncodedAnimation, rebuilt here so reading the store doesn't import the encoders
+StoredAnimation = namedtuple("StoredAnimation", ["format", "extension", "data", "frame_count"])
+
+ENTRY_SUFFIX = ".render"
+
+
+def get_sprite_set_version(patterns_folder_path):
+    # Changes whenever a sprite is added, removed, renamed or edited, so stale renders are never served
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(patterns_folder_path, "*.png"))):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:16]
+
+
+def serialize_result(result):
+    # One JSON header line, then the raw outputs back to back
+    if isinstance(result, list):
+        header = {"kind": "png", "sizes": [len(chunk) for chunk in result]}
+        payload = b"".join(result)
+    else:
+        header = {"kind": "animation", "format": result.format, "extension": result.extension,
+                  "frame_count": result.frame_count}
+        payload = result.data
+    return json.dumps(header).encode() + b"\n" + payload
+
+
+def deserialize_result(data):
+    header_line, payload = data.split(b"\n", 1)
+    header = json.loads(header_line)
+    if header["kind"] == "animation":
+        return StoredAnimation(header["format"], header["extension"], payload, header["frame_count"])
+
+    chunks = []
+    position = 0
+    for size in header["sizes"]:
+        chunks.append(payload[position:position + size])
+        position += size
+    return chunks
+
+
+class RenderStore:
+    # On-disk render outputs, content-addressed by a hash of the render key and the sprite set version.
+    # Entries are written to a temporary file and renamed into place, so other bot processes sharing the folder
+    # never read a partial file. Eviction goes by modification time, which get() refreshes, oldest first.
+
+    def __init__(self, folder_path, max_bytes, version):
+        self.folder_path = folder_path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder_path, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._scan())
+
+    def _path(self, key):
+        digest = hashlib.sha256(repr((key, self.version)).encode()).hexdigest()
+        return os.path.join(self.folder_path, digest + ENTRY_SUFFIX)
+
+    def _scan(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.folder_path, "*" + ENTRY_SUFFIX)):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return deserialize_result(data)
+
+    def put(self, key, result):
+        if not result:
+            return
+
+        data = serialize_result(result)
+        if len(data) > self.max_bytes:
+            return
+
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.folder_path, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, self._path(key))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError:
+            logging.exception("No se pudo guardar el render en disco.")
+            return
+
+        self.total_bytes += len(data)
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        # Rescanned instead of trusting total_bytes, other processes write to the same folder
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        self.total_bytes = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
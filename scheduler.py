@@ -0,0 +1,129 @@
+import time
+import asyncio
+from collections import OrderedDict, deque
+
+# Lower runs first, cheap PNG montages don't wait behind long GIFs
+PRIORITY_PNG = 0
+PRIORITY_GIF = 1
+# Cache warming, only runs when no user render is waiting
+PRIORITY_WARM = 2
+
+WAIT_SAMPLES = 1000
+
+
+class ConcurrencyLimit:
+    # Cap on running renders shared by several schedulers, a slot freed in one lets the others dispatch,
+    # starting with the one after the last to go first so no scheduler always gets the freed slot
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max_concurrent
+        self.running = 0
+        self.schedulers = []
+
+    def has_room(self):
+        return self.running < self.max_concurrent
+
+    def _release(self):
+        self.running -= 1
+        for scheduler in list(self.schedulers):
+            scheduler._dispatch()
+        if self.schedulers:
+            self.schedulers.append(self.schedulers.pop(0))
+
+    def stats(self):
+        return {"running": self.running, "max_concurrent": self.max_concurrent}
+
+
+class RenderScheduler:
+    # Admission control for renders: at most max_concurrent run at once, waiting jobs are grouped per user
+    # and each priority level is served round-robin across users, so one user can't starve everyone else.
+    # With a ConcurrencyLimit, a job also needs one of its slots, shared with the limit's other schedulers.
+
+    def __init__(self, max_concurrent, limit=None):
+        self.max_concurrent = max_concurrent
+        self.limit = limit
+        if limit is not None:
+            limit.schedulers.append(self)
+        self.running = 0
+        # priority -> OrderedDict(user id -> deque of (future, enqueued at))
+        self.queues = {}
+        self.wait_times = deque(maxlen=WAIT_SAMPLES)
+        self.completed = 0
+
+    async def run(self, user_id, priority, create_coroutine):
+        await self._acquire(user_id, priority)
+        try:
+            return await create_coroutine()
+        finally:
+            self.completed += 1
+            self._release()
+
+    async def _acquire(self, user_id, priority):
+        future = asyncio.get_running_loop().create_future()
+        user_queues = self.queues.setdefault(priority, OrderedDict())
+        user_queues.setdefault(user_id, deque()).append((future, time.monotonic()))
+        # Resolves the future right away when there's a free slot
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted a slot right as the caller was cancelled, hand it on. Otherwise _next skips the dead entry.
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self.running -= 1
+        if self.limit is None:
+            self._dispatch()
+        else:
+            self.limit._release()
+
+    def _dispatch(self):
+        while self.running < self.max_concurrent and (self.limit is None or self.limit.has_room()):
+            entry = self._next()
+            if entry is None:
+                return
+
+            future, enqueued_at = entry
+            self.running += 1
+            if self.limit is not None:
+                self.limit.running += 1
+            self.wait_times.append(time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    def _next(self):
+        for priority in sorted(self.queues):
+            user_queues = self.queues[priority]
+            while user_queues:
+                user_id, jobs = next(iter(user_queues.items()))
+                future, enqueued_at = jobs.popleft()
+
+                # Round-robin: a user with more jobs waiting goes to the back of the line
+                if jobs:
+                    user_queues.move_to_end(user_id)
+                else:
+                    del user_queues[user_id]
+
+                if not future.done():
+                    return future, enqueued_at
+        return None
+
+    def queue_depth(self, priority=None):
+        priorities = self.queues if priority is None else [priority]
+        return sum(not future.done()
+                   for p in priorities for jobs in self.queues.get(p, {}).values() for future, _ in jobs)
+
+    def stats(self):
+        waits = sorted(self.wait_times)
+        return {
+            "running": self.running,
+            "max_concurrent": self.max_concurrent,
+            "queued_png": self.queue_depth(PRIORITY_PNG),
+            "queued_gif": self.queue_depth(PRIORITY_GIF),
+            "completed": self.completed,
+            "wait_mean_s": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p95_s": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            "wait_max_s": waits[-1] if waits else 0.0,
+        }
@@ -0,0 +1,43 @@
+from collections import namedtuple
+from scheduler import ConcurrencyLimit, RenderScheduler
+from cancellation import CANCEL_SLOTS, CancelBoard
+
+# A shard's own worker processes, the scheduler that admits renders into them and the flags that cancel them
+RenderLane = namedtuple("RenderLane", ["pool", "scheduler", "cancel_board"])
+
+
+def get_shard_id(guild_id, shard_count):
+    # Same formula Discord uses to route a guild's events, DMs always go to shard 0
+    if guild_id is None or not shard_count:
+        return 0
+    return (guild_id >> 22) % shard_count
+
+
+class RenderLanes:
+    # One render lane per shard, created the first time the shard renders something, so a busy shard's GIFs
+    # can't take the workers the other shards' users are waiting on. workers and max_concurrent are per lane,
+    # max_concurrent_total caps the running renders of every lane together.
+
+    def __init__(self, patterns_folder_path, workers, max_concurrent, max_concurrent_total):
+        self.patterns_folder_path = patterns_folder_path
+        self.workers = workers
+        self.max_concurrent = max_concurrent
+        self.limit = ConcurrencyLimit(max_concurrent_total)
+        # shard id -> RenderLane
+        self.lanes = {}
+
+    def get(self, shard_id):
+        lane = self.lanes.get(shard_id)
+        if lane is None:
+            # Imported here so the bot can connect before the renderer is loaded
+            from render import IMAGE_LIMIT, create_render_pool
+
+            # A PNG render submits up to IMAGE_LIMIT chunk jobs, plus one for a preview
+            cancel_board = CancelBoard(max(CANCEL_SLOTS, self.max_concurrent * IMAGE_LIMIT + 1))
+            lane = RenderLane(create_render_pool(self.patterns_folder_path, self.workers, cancel_board.flags),
+                              RenderScheduler(self.max_concurrent, self.limit), cancel_board)
+            self.lanes[shard_id] = lane
+        return lane
+
+    def stats(self):
+        return {shard_id: lane.scheduler.stats() for shard_id, lane in sorted(self.lanes.items())}
@@ -0,0 +1,45 @@
+import asyncio
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one in-progress task and all get its result (or its exception).
+    # The task is cancelled when every caller waiting on it has been cancelled.
+
+    def __init__(self):
+        self.in_flight = {}
+        # key -> callers waiting on its task
+        self.waiters = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    async def run(self, key, create_coroutine):
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(create_coroutine())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            # shield: one caller giving up must not cancel the render the others are waiting on
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self.waiters[key] == 1 and not task.done():
+                # Nobody is left to use the result, later calls start over instead of joining the cancelled task
+                task.cancel()
+                self._forget(key, task)
+            raise
+        finally:
+            self.waiters[key] -= 1
+            if not self.waiters[key]:
+                del self.waiters[key]
+
+    def _forget(self, key, task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
@@ -0,0 +1,85 @@
+import os
+import glob
+import numpy as np
+from PIL import Image
+from compositor import blend_on_blank
+from encoders import GIF_TRANSPARENT_INDEX
+
+TILE_SIZE = (124, 124)
+
+
+def list_pattern_names(folder_path):
+    # Sorted, so the bot process and every render worker agree on the tile ids without loading the images
+    paths = sorted(glob.glob(os.path.join(folder_path, "*.png")))
+    if not paths:
+        raise ValueError(f"No se encontraron patrones en '{folder_path}'.")
+    return [os.path.splitext(os.path.basename(path))[0] for path in paths]
+
+
+class SpriteAtlas:
+    # Everything is indexed by tile id, the position of the pattern's name in list_pattern_names
+
+    def __init__(self, folder_path, tile_size=TILE_SIZE):
+        self.folder_path = folder_path
+        self.tile_size = tile_size
+        self.names = list_pattern_names(folder_path)
+        self.ids = {name: tile_id for tile_id, name in enumerate(self.names)}
+        self.sprites = []
+        self.arrays = []
+        self.indexed = []
+        self.palette = None
+
+        for name in self.names:
+            with Image.open(os.path.join(folder_path, f"{name}.png")) as img:
+                if img.size != tile_size:
+                    raise ValueError(
+                        f"El patrón '{name}' mide {img.size[0]}x{img.size[1]} en vez de {tile_size[0]}x{tile_size[1]}.")
+                # convert() forces the full decode, so nothing is left pointing at the file
+                sprite = img.convert("RGBA")
+
+            array = np.asarray(sprite)
+            self.sprites.append(sprite)
+            self.arrays.append((array, blend_on_blank(array)))
+
+        self.widths = np.array([sprite.size[0] for sprite in self.sprites])
+        self._index_sprites()
+
+    def _index_sprites(self):
+        # One palette shared by every sprite, GIF frames are built straight in it instead of quantizing each frame
+        opaque_pixels = np.concatenate([array[array[..., 3] >= 128][:, :3] for array, _ in self.arrays])
+        palette_image = Image.fromarray(opaque_pixels[np.newaxis], "RGB").quantize(colors=255)
+
+        colors = palette_image.getpalette()[:255 * 3]
+        # Index 0 is the transparent colour, the quantized colours are shifted up by one
+        self.palette = [0, 0, 0] + colors + [0] * (255 * 3 - len(colors))
+
+        for array, _ in self.arrays:
+            rgb = Image.fromarray(np.ascontiguousarray(array[..., :3]), "RGB")
+            indices = np.asarray(rgb.quantize(palette=palette_image, dither=Image.Dither.NONE)) + 1
+            opaque = array[..., 3] >= 128
+            indices[~opaque] = GIF_TRANSPARENT_INDEX
+
+            indexed = Image.fromarray(indices.astype(np.uint8), "P")
+            indexed.putpalette(self.palette)
+            self.indexed.append((indexed, Image.fromarray(opaque)))
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, name):
+        try:
+            return self.sprites[self.ids[name]]
+        except KeyError:
+            raise ValueError(f"No existe el patrón '{name}'.") from None
+
+    def get_tiles(self, tile_ids):
+        return [self.sprites[tile_id] for tile_id in tile_ids]
+
+    def get_tile_arrays(self, tile_ids):
+        return [self.arrays[tile_id] for tile_id in tile_ids]
+
+    def get_indexed_tiles(self, tile_ids):
+        return [self.indexed[tile_id] for tile_id in tile_ids]
@@ -0,0 +1,41 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+from pattern_ir import encode_patterns, layout_row
+from sprites import SpriteAtlas
+from utils import BEATMAP_MARGIN, create_beatmap_image
+from tests import baseline_utils
+
+PATTERNS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "patterns")
+
+
+@pytest.fixture(scope="module")
+def atlas():
+    return SpriteAtlas(PATTERNS_FOLDER)
+
+
+def create_baseline_image(names):
+    paths = [os.path.join(PATTERNS_FOLDER, f"{name}.png") for name in names]
+    return baseline_utils.create_beatmap_image(paths)
+
+
+def create_image(atlas, names):
+    ir = encode_patterns([(name, 0) for name in names], atlas.ids)
+    return create_beatmap_image(atlas.get_tile_arrays(ir.tile_ids), layout_row(ir, atlas.widths, BEATMAP_MARGIN))
+
+
+def test_matches_paste_loop_on_example(atlas):
+    names = [name for name, _ in baseline_utils.get_patterns_from_text("(dkdkd)(kdkdk)[kdkd] dk")]
+    assert np.array_equal(np.asarray(create_image(atlas, names)), np.asarray(create_baseline_image(names)))
+
+
+def test_matches_paste_loop_on_random_montages(atlas):
+    generator = random.Random(7)
+    for _ in range(200):
+        # Up to a PNG chunk's worth of tiles, as render_png_chunk composites them
+        names = generator.choices(atlas.names, k=generator.randint(0, 16))
+        expected = np.asarray(create_baseline_image(names))
+        assert np.array_equal(np.asarray(create_image(atlas, names)), expected), names
@@ -0,0 +1,65 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cancellation import CancelBoard, RenderCancelled, check_cancelled
+
+# Renders run in worker processes, a thread pool sharing the flags runs the same code paths
+started = threading.Event()
+
+
+def render(flags, token=None):
+    started.set()
+    while True:
+        check_cancelled(flags, token)
+        time.sleep(0.001)
+
+
+def echo(value, token=None):
+    return value, token.slot
+
+
+def test_cancelled_job_stops_and_its_slot_is_reused():
+    async def main():
+        board = CancelBoard(1)
+        pool = ThreadPoolExecutor(2)
+        started.clear()
+
+        job = asyncio.ensure_future(board.run(pool, time.time() + 10, render, board.flags))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        job.cancel()
+
+        # The only slot comes back once the worker notices, the next job gets it with its flag cleared
+        result = await asyncio.wait_for(board.run(pool, time.time() + 10, echo, "next"), 5)
+        pool.shutdown()
+        return result, board
+
+    (value, slot), board = asyncio.run(main())
+    assert (value, slot) == ("next", 0)
+    assert board.free == [0]
+
+
+def test_jobs_wait_for_a_free_slot():
+    async def main():
+        board = CancelBoard(2)
+        with ThreadPoolExecutor(4) as pool:
+            return await asyncio.gather(*[board.run(pool, time.time() + 10, echo, i) for i in range(6)]), board
+
+    results, board = asyncio.run(main())
+    assert [value for value, _ in results] == list(range(6))
+    assert sorted(board.free) == [0, 1]
+
+
+def test_deadline():
+    async def main():
+        board = CancelBoard(1)
+        with ThreadPoolExecutor(1) as pool:
+            with pytest.raises(RenderCancelled):
+                await board.run(pool, time.time() + 0.05, render, board.flags)
+            with pytest.raises(RenderCancelled):
+                await board.run(pool, time.time() - 1, echo, "late")
+
+    asyncio.run(main())
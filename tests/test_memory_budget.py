@@ -0,0 +1,87 @@
+import asyncio
+
+from memory_budget import MemoryBudget
+
+
+async def admit(budget, requests):
+    # requests: (name, bytes, priority), queued in order behind a reservation of the whole budget
+    order = []
+    release = asyncio.Event()
+
+    async def hold():
+        async with budget.reserve(budget.max_bytes):
+            await release.wait()
+
+    async def reserve(name, size, priority):
+        async with budget.reserve(size, priority):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    blocker = asyncio.ensure_future(hold())
+    await asyncio.sleep(0)
+    tasks = [asyncio.ensure_future(reserve(*request)) for request in requests]
+    await asyncio.sleep(0)
+    assert budget.stats()["waiting"] == len(requests)
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+    return order
+
+
+def test_fifo_admission():
+    budget = MemoryBudget(100)
+    # small2 would fit next to big, it still waits its turn
+    order = asyncio.run(admit(budget, [("small1", 10, 1), ("big", 80, 1), ("small2", 10, 1), ("small3", 30, 1)]))
+    assert order == ["small1", "big", "small2", "small3"]
+    assert budget.stats() == {"used_bytes": 0, "max_bytes": 100, "running": 0, "waiting": 0}
+
+
+def test_oversized_reservation_runs_alone():
+    async def main():
+        budget = MemoryBudget(100)
+        peaks = []
+
+        async def reserve(size):
+            async with budget.reserve(size):
+                peaks.append((size, budget.stats()["running"]))
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(reserve(10), reserve(500), reserve(10))
+        return peaks, budget
+
+    peaks, budget = asyncio.run(main())
+    assert (500, 1) in peaks
+    assert budget.used_bytes == 0
+
+
+def test_priority_goes_ahead_of_a_waiting_big_render():
+    order = asyncio.run(admit(MemoryBudget(100), [("gif", 90, 1), ("png", 10, 0)]))
+    assert order == ["png", "gif"]
+
+
+def test_cancelled_waiter_unblocks_the_ones_behind():
+    async def main():
+        budget = MemoryBudget(100)
+        release = asyncio.Event()
+
+        async def hold(size):
+            async with budget.reserve(size):
+                await release.wait()
+
+        held = asyncio.ensure_future(hold(50))
+        await asyncio.sleep(0)
+        big = asyncio.ensure_future(hold(80))
+        small = asyncio.ensure_future(hold(40))
+        await asyncio.sleep(0)
+        assert budget.stats()["running"] == 1
+
+        # small fits but was queued behind big, cancelling big lets it in
+        big.cancel()
+        await asyncio.sleep(0)
+        running = budget.stats()["running"]
+        release.set()
+        await asyncio.gather(held, small)
+        return running, budget
+
+    running, budget = asyncio.run(main())
+    assert running == 2
+    assert budget.used_bytes == 0
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from utils import PatternSyntaxError, get_patterns_from_text
+from tests import baseline_utils
+
+
+def parse_baseline(text):
+    try:
+        return baseline_utils.get_patterns_from_text(text)
+    except ValueError as e:
+        return e
+
+
+def parse(text):
+    try:
+        return get_patterns_from_text(text)
+    except ValueError as e:
+        return e
+
+
+def random_text(generator):
+    # Mostly valid groups of every length, with the occasional stray or unknown symbol
+    parts = []
+    for _ in range(generator.randint(0, 8)):
+        kind = generator.random()
+        notes = "".join(generator.choices("kdKD", k=generator.randint(1, 14)))
+        if kind < 0.35:
+            parts.append(f"({notes})")
+        elif kind < 0.7:
+            parts.append(f"[{notes}]")
+        elif kind < 0.9:
+            parts.append(notes + " " * generator.randint(0, 1))
+        else:
+            parts.append(generator.choice(["(", ")", "[", "]", "((", "x", "()", "[)", "(k[d])"]))
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("text", [
+    "", " ", "dkkd dkkd kddk", "(dkdkd)(kdkdk)(dkdkdk)(kdkdkd)(dkdkdkd)(kdkdkdk)",
+    "d k (dkd) [kdkd] dd (kdkdk) [dkdkdk] k", "(" + "dk" * 40 + ")", "[" + "kd" * 40 + "]",
+])
+def test_same_tokens_as_baseline(text):
+    assert get_patterns_from_text(text) == baseline_utils.get_patterns_from_text(text)
+
+
+@pytest.mark.parametrize("text", ["(", ")", "(dk", "dk]", "(dk]", "((dk))", "(dk[d])", "(dk))", "dkx"])
+def test_rejected_like_baseline(text):
+    with pytest.raises(ValueError):
+        baseline_utils.get_patterns_from_text(text)
+    with pytest.raises(PatternSyntaxError):
+        get_patterns_from_text(text)
+
+
+def test_same_as_baseline_on_random_inputs():
+    generator = random.Random(9)
+    for _ in range(20000):
+        text = random_text(generator)
+        expected = parse_baseline(text)
+        result = parse(text)
+        if isinstance(expected, ValueError):
+            # With several errors in one input the first one by position is reported, not always the baseline's
+            assert isinstance(result, PatternSyntaxError), text
+        else:
+            assert result == expected, text
@@ -0,0 +1,63 @@
+import os
+import shutil
+
+from render_store import ENTRY_SUFFIX, RenderStore, StoredAnimation, get_sprite_set_version
+
+KEY = ("dkkd", True, 120.0, "gif", 10 * 2 ** 20)
+
+
+def list_entries(folder):
+    return sorted(name for name in os.listdir(folder) if name.endswith(ENTRY_SUFFIX))
+
+
+def test_round_trip(tmp_path):
+    store = RenderStore(str(tmp_path), 2 ** 20, "v1")
+    animation = StoredAnimation("gif", "gif", b"GIF89a" + bytes(100), 12)
+    store.put(KEY, animation)
+    store.put(("dkkd", False, None, None, None), [b"png1", b"png22"])
+
+    assert store.get(KEY) == animation
+    assert store.get(("dkkd", False, None, None, None)) == [b"png1", b"png22"]
+    assert store.get(("kddk", True, 120.0, "gif", 10 * 2 ** 20)) is None
+    assert (store.hits, store.misses) == (2, 1)
+
+
+def test_version_mismatch_misses(tmp_path):
+    RenderStore(str(tmp_path), 2 ** 20, "v1").put(KEY, [b"png"])
+    assert RenderStore(str(tmp_path), 2 ** 20, "v1").get(KEY) == [b"png"]
+    assert RenderStore(str(tmp_path), 2 ** 20, "v2").get(KEY) is None
+
+
+def test_sprite_set_version_follows_the_sprites(tmp_path):
+    patterns = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "patterns")
+    folder = tmp_path / "patterns"
+    shutil.copytree(patterns, folder)
+    version = get_sprite_set_version(str(folder))
+    assert get_sprite_set_version(str(folder)) == version
+
+    with open(folder / "1d.png", "ab") as f:
+        f.write(b"\0")
+    assert get_sprite_set_version(str(folder)) != version
+
+
+def test_eviction_drops_the_least_recently_used(tmp_path):
+    store = RenderStore(str(tmp_path), 2500, "v1")
+    keys = [("pattern", True, 120.0, "gif", i) for i in range(3)]
+    for i, key in enumerate(keys):
+        store.put(key, [bytes(1000)])
+        # mtimes a second apart, the filesystem may not keep anything finer
+        os.utime(store._path(key), (i, i))
+    assert len(list_entries(tmp_path)) == 2
+    assert store.get(keys[0]) is None
+
+    # Reading refreshes an entry, so the other one is evicted next
+    store.get(keys[1])
+    store.put(("pattern", True, 120.0, "gif", 3), [bytes(1000)])
+    assert store.get(keys[1]) is not None
+    assert store.get(keys[2]) is None
+    assert store.total_bytes <= 2500
+
+
+def test_reopening_counts_the_existing_entries(tmp_path):
+    RenderStore(str(tmp_path), 2 ** 20, "v1").put(KEY, [bytes(1000)])
+    assert RenderStore(str(tmp_path), 2 ** 20, "v1").stats()["bytes"] > 1000
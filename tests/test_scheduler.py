@@ -0,0 +1,58 @@
+import asyncio
+
+from scheduler import PRIORITY_GIF, PRIORITY_PNG, PRIORITY_WARM, RenderScheduler
+
+
+async def run_jobs(scheduler, jobs):
+    # jobs: (user id, priority, name), queued in order behind a job holding the only slot
+    order = []
+    release = asyncio.Event()
+
+    async def hold():
+        await release.wait()
+
+    async def record(name):
+        order.append(name)
+
+    blocker = asyncio.ensure_future(scheduler.run("blocker", PRIORITY_PNG, hold))
+    await asyncio.sleep(0)
+    tasks = [asyncio.ensure_future(scheduler.run(user_id, priority, lambda name=name: record(name)))
+             for user_id, priority, name in jobs]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+    return order
+
+
+def test_round_robin_across_users():
+    jobs = [("a", PRIORITY_GIF, "a1"), ("a", PRIORITY_GIF, "a2"), ("a", PRIORITY_GIF, "a3"),
+            ("b", PRIORITY_GIF, "b1"), ("b", PRIORITY_GIF, "b2"), ("c", PRIORITY_GIF, "c1")]
+    order = asyncio.run(run_jobs(RenderScheduler(1), jobs))
+    assert order == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_priority_order():
+    jobs = [("a", PRIORITY_WARM, "warm"), ("a", PRIORITY_GIF, "gif"), ("b", PRIORITY_GIF, "gif_b"),
+            ("b", PRIORITY_PNG, "png")]
+    order = asyncio.run(run_jobs(RenderScheduler(1), jobs))
+    assert order == ["png", "gif", "gif_b", "warm"]
+
+
+def test_cancelled_waiter_is_skipped():
+    async def main():
+        scheduler = RenderScheduler(1)
+        release = asyncio.Event()
+        blocker = asyncio.ensure_future(scheduler.run("a", PRIORITY_GIF, release.wait))
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(scheduler.run("b", PRIORITY_GIF, lambda: asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        release.set()
+        await blocker
+        # The slot isn't leaked to the cancelled job
+        assert await scheduler.run("c", PRIORITY_GIF, lambda: asyncio.sleep(0, "done")) == "done"
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert stats["running"] == 0
+    assert stats["queued_gif"] == 0
@@ -0,0 +1,70 @@
+import asyncio
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    async def main():
+        flights = SingleFlight()
+        runs = []
+
+        async def render():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*[flights.run("key", render) for _ in range(3)])
+        return results, runs, flights
+
+    results, runs, flights = asyncio.run(main())
+    assert results == ["result"] * 3
+    assert len(runs) == 1
+    assert flights.coalesced == 2
+    assert len(flights) == 0
+
+
+def test_one_waiter_cancelling_keeps_the_run():
+    async def main():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def render():
+            await release.wait()
+            return "result"
+
+        first = asyncio.ensure_future(flights.run("key", render))
+        second = asyncio.ensure_future(flights.run("key", render))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await second
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_last_waiter_cancelling_cancels_the_run():
+    async def main():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def render():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.ensure_future(flights.run("key", render)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+        # A later call starts over instead of joining the cancelled run
+        return await flights.run("key", lambda: asyncio.sleep(0, "again")), flights
+
+    result, flights = asyncio.run(main())
+    assert result == "again"
+    assert flights.started == 2
+    assert not flights.waiters
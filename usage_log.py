@@ -0,0 +1,86 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+from collections import Counter
+
+# Compaction keeps this many distinct inputs, the rest of the long tail is dropped
+USAGE_LOG_MAX_KEYS = 10000
+
+
+class UsageLog:
+    # Counts of normalized command inputs, kept in an append-only file of JSON lines [count, command, key].
+    # Appends are single small writes, so several bot processes can share the file. It's compacted into one
+    # line per input when loaded, a record appended by another process during the compaction can be lost.
+    # Nothing touches the disk until load(), records are buffered and written by flush(), both meant to run in an
+    # executor while record() is called from the event loop, the lock is never held during file I/O.
+
+    def __init__(self, path, max_keys=USAGE_LOG_MAX_KEYS):
+        self.path = path
+        self.max_keys = max_keys
+        # (command, key) -> count, keys are tuples so they can be used as render keys again
+        self.counts = Counter()
+        # Lines recorded but not written yet
+        self.pending = []
+        self.file = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        loaded = self._read()
+        with self.lock:
+            self.counts.update(loaded)
+            counts = self.counts.copy()
+            # Counted already, so the compacted file includes them, later records wait for the file to be open
+            self.pending.clear()
+        self._compact(counts)
+        file = open(self.path, "a", buffering=1, encoding="utf-8")
+        with self.lock:
+            self.file = file
+
+    def _read(self):
+        counts = Counter()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        count, command, key = json.loads(line)
+                    except ValueError:  # a line cut short by a crash
+                        continue
+                    counts[(command, tuple(key))] += count
+        except FileNotFoundError:
+            pass
+        return counts
+
+    def _compact(self, counts):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for (command, key), count in counts.most_common(self.max_keys):
+                    f.write(json.dumps([count, command, key]) + "\n")
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def record(self, command, key):
+        with self.lock:
+            self.counts[(command, key)] += 1
+            self.pending.append(json.dumps([1, command, key]) + "\n")
+
+    def flush(self):
+        with self.lock:
+            if self.file is None or not self.pending:
+                return
+            lines, self.pending = self.pending, []
+        try:
+            self.file.write("".join(lines))
+        except OSError:
+            logging.exception("No se pudo escribir en el registro de uso.")
+
+    def most_common(self, command, n):
+        with self.lock:
+            counts = self.counts.most_common()
+        return [key for (logged_command, key), _ in counts if logged_command == command][:n]
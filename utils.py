@@ -1,4 +1,5 @@
-from PIL import Image
+from functools import lru_cache
+from operator import itemgetter
 
 
 def do_open_and_closing_symbols_match(input_string, opening_symbol, closing_symbol):
@@ -22,193 +23,183 @@ def do_open_and_closing_symbols_match(input_string, opening_symbol, closing_symb
     return balanced and not stack
 
 
-def validate_symbol_balance(text):
-    stack = []
-    for char in text:
-        if char == "(" or char == "[":
-            if stack:  # Check if there is already an open symbol
-                raise ValueError("No se pueden poner paréntesis o corchetes dentro de sí mismos.")
-            stack.append(char)
-        elif char == ")" or char == "]":
-            if not stack:
-                raise ValueError("Símbolo de cierre sin su símbolo de apertura correspondiente.")
-            if (char == ")" and stack[-1] != "(") or (char == "]" and stack[-1] != "["):
-                raise ValueError("No concuerda el símbolo de clausura con el de apertura.")
-            stack.pop()
-
-    if stack:
-        raise ValueError("Paréntesis o corchetes desbalanceados.")
-
-
-def validate_characters(text, separators):
-    for char in text:
-        if char not in separators and char not in {"k", "d", " "}:
-            raise ValueError(f"El caracter '{char}' no es válido.")
+OPENING_SYMBOLS = {"(": ")", "[": "]"}
+CLOSING_SYMBOLS = {")": "(", "]": "["}
+NOTES = {"k", "d", " "}
 
 
-def validate_duplicate_symbols(text, separators):
-    for count, char in enumerate(text[:-1]):
-        if char == text[count + 1] and char in separators:
-            raise ValueError(f"Símbolo '{char}' duplicado encontrado.")
+class PatternSyntaxError(ValueError):
+    def __init__(self, message, position):
+        # position is 1-based, it's shown to users
+        super().__init__(f"{message} (posición {position})")
+        self.position = position
 
 
-def validate_symbol_counts(text):
-    open_paren_count = text.count("(")
-    close_paren_count = text.count(")")
-    open_brack_count = text.count("[")
-    close_brack_count = text.count("]")
+def _template(*parts):
+    # Integers are indexes into the group's notes, e.g. _template("1", 0, "6", 1) -> ("1%s6%s", itemgetter(0, 1))
+    indexes = [part for part in parts if isinstance(part, int)]
+    return "".join("%s" if isinstance(part, int) else part for part in parts), itemgetter(*indexes)
 
-    if open_paren_count != close_paren_count or open_brack_count != close_brack_count:
-        raise ValueError("No coinciden los símbolos de apertura con los de clausura.")
 
-
-def process_1_6_patterns(normalized_text, i):
+def _1_6_templates(j):
     result = []
-    j = 0
-    while normalized_text[i + j + 1] != ")":
-        j += 1
 
     if j == 1:
-        result.append((f"1{normalized_text[i + 1]}", 0))
+        result.append((_template("1", 0), 0))
 
     elif j == 2:
-        result.append((f"1{normalized_text[i + 1]}6{normalized_text[i + 2]}", 0))
-        result.append((f"6{normalized_text[i + 2]}2", 1 / 3))
+        result.append((_template("1", 0, "6", 1), 0))
+        result.append((_template("6", 1, "2"), 1 / 3))
 
     elif j == 3:
-        result.append((f"1{normalized_text[i + 1]}6{normalized_text[i + 2]}", 0))
-        result.append((f"6{normalized_text[i + 2]}6{normalized_text[i + 3]}", 0))
-        result.append((f"6{normalized_text[i + 3]}1", 2 / 3))
+        result.append((_template("1", 0, "6", 1), 0))
+        result.append((_template("6", 1, "6", 2), 0))
+        result.append((_template("6", 2, "1"), 2 / 3))
 
     elif j == 4:
-        result.append((f"1{normalized_text[i + 1]}6{normalized_text[i + 2]}", 0))
-        result.append((f"6{normalized_text[i + 2]}6{normalized_text[i + 3]}", 0))
-        result.append((f"6{normalized_text[i + 3]}1{normalized_text[i + 4]}", 0))
+        result.append((_template("1", 0, "6", 1), 0))
+        result.append((_template("6", 1, "6", 2), 0))
+        result.append((_template("6", 2, "1", 3), 0))
 
     elif j >= 5 and j % 3 == 2:
-        result.append((f"1{normalized_text[i + 1]}6{normalized_text[i + 2]}", 0))
+        result.append((_template("1", 0, "6", 1), 0))
         y = 2
         while y < j - 1:
-            result.append((f"6{normalized_text[i + y]}6{normalized_text[i + y + 1]}", 0))
-            result.append((f"6{normalized_text[i + y + 1]}1{normalized_text[i + y + 2]}6{normalized_text[i + y + 3]}", 0))
+            result.append((_template("6", y - 1, "6", y), 0))
+            result.append((_template("6", y, "1", y + 1, "6", y + 2), 0))
             y += 3
-        result.append((f"6{normalized_text[i + j]}2", 1 / 3))
+        result.append((_template("6", j - 1, "2"), 1 / 3))
 
     elif j >= 6 and j % 3 == 0:
-        result.append((f"1{normalized_text[i + 1]}6{normalized_text[i + 2]}", 0))
-        result.append((f"6{normalized_text[i + 2]}6{normalized_text[i + 3]}", 0))
+        result.append((_template("1", 0, "6", 1), 0))
+        result.append((_template("6", 1, "6", 2), 0))
         y = 3
         while y < j - 1:
-            result.append((f"6{normalized_text[i + y]}1{normalized_text[i + y + 1]}6{normalized_text[i + y + 2]}", 0))
-            result.append((f"6{normalized_text[i + y + 2]}6{normalized_text[i + y + 3]}", 0))
+            result.append((_template("6", y - 1, "1", y, "6", y + 1), 0))
+            result.append((_template("6", y + 1, "6", y + 2), 0))
             y += 3
-        result.append((f"6{normalized_text[i + j]}1", 2 / 3))
+        result.append((_template("6", j - 1, "1"), 2 / 3))
 
     elif j >= 7 and j % 3 == 1:
-        result.append((f"1{normalized_text[i + 1]}6{normalized_text[i + 2]}", 0))
-        result.append((f"6{normalized_text[i + 2]}6{normalized_text[i + 3]}", 0))
+        result.append((_template("1", 0, "6", 1), 0))
+        result.append((_template("6", 1, "6", 2), 0))
         y = 3
         while y < j - 1:
-            result.append((f"6{normalized_text[i + y]}1{normalized_text[i + y + 1]}6{normalized_text[i + y + 2]}", 0))
-            result.append((f"6{normalized_text[i + y + 2]}6{normalized_text[i + y + 3]}", 0))
+            result.append((_template("6", y - 1, "1", y, "6", y + 1), 0))
+            result.append((_template("6", y + 1, "6", y + 2), 0))
             y += 3
-        result.append((f"6{normalized_text[i + j - 1]}1{normalized_text[i + j]}", 0))
+        result.append((_template("6", j - 2, "1", j - 1), 0))
 
-    return result, j + 2
+    return result
 
 
-def process_1_8_patterns(normalized_text, i):
+def _1_8_templates(j):
     result = []
-    j = 0
-    while normalized_text[i + j + 1] != "]":
-        j += 1
 
     if j == 1:
-        result.append((f"1{normalized_text[i + 1]}", 0))
+        result.append((_template("1", 0), 0))
 
     elif j == 2:
-        result.append((f"1{normalized_text[i + 1]}8{normalized_text[i + 2]}", 0))
-        result.append((f"8{normalized_text[i + 2]}", 1 / 2))
+        result.append((_template("1", 0, "8", 1), 0))
+        result.append((_template("8", 1), 1 / 2))
 
     elif j == 3:
-        result.append((f"1{normalized_text[i + 1]}8{normalized_text[i + 2]}", 0))
-        result.append((f"8{normalized_text[i + 2]}1{normalized_text[i + 3]}", 0))
+        result.append((_template("1", 0, "8", 1), 0))
+        result.append((_template("8", 1, "1", 2), 0))
 
     elif j == 4:
-        result.append((f"1{normalized_text[i + 1]}8{normalized_text[i + 2]}", 0))
-        result.append((f"8{normalized_text[i + 2]}1{normalized_text[i + 3]}8{normalized_text[i + 4]}", 0))
-        result.append((f"8{normalized_text[i + 4]}", 1 / 2))
+        result.append((_template("1", 0, "8", 1), 0))
+        result.append((_template("8", 1, "1", 2, "8", 3), 0))
+        result.append((_template("8", 3), 1 / 2))
 
     elif j >= 5 and j % 2 == 1:
         y = 1
-        result.append((f"1{normalized_text[i + y]}8{normalized_text[i + y + 1]}", 0))
+        result.append((_template("1", y - 1, "8", y), 0))
         while y < j - 2:
-            result.append((f"8{normalized_text[i + y + 1]}1{normalized_text[i + y + 2]}8{normalized_text[i + y + 3]}", 0))
+            result.append((_template("8", y, "1", y + 1, "8", y + 2), 0))
             y += 2
-        result.append((f"8{normalized_text[i + y + 1]}1{normalized_text[i + y + 2]}", 0))
+        result.append((_template("8", y, "1", y + 1), 0))
 
     elif j >= 6 and j % 2 == 0:
         y = 1
-        result.append((f"1{normalized_text[i + y]}8{normalized_text[i + y + 1]}", 0))
+        result.append((_template("1", y - 1, "8", y), 0))
         while y < j - 1:
-            result.append((f"8{normalized_text[i + y + 1]}1{normalized_text[i + y + 2]}8{normalized_text[i + y + 3]}", 0))
+            result.append((_template("8", y, "1", y + 1, "8", y + 2), 0))
             y += 2
-        result.append((f"8{normalized_text[i + y + 1]}", 1 / 2))
+        result.append((_template("8", y), 1 / 2))
+
+    return result
 
-    return result, j + 2
+
+@lru_cache(maxsize=None)
+def get_group_templates(opening_symbol, length):
+    # The expansion of a group only depends on its kind and length, the notes are filled in afterwards
+    if opening_symbol == "(":
+        return tuple(_1_6_templates(length))
+    return tuple(_1_8_templates(length))
+
+
+def expand_group(opening_symbol, notes):
+    return [(template % get_notes(notes), overlap)
+            for (template, get_notes), overlap in get_group_templates(opening_symbol, len(notes))]
 
 
 def get_patterns_from_text(text):
-    separators = {"(", ")", "[", "]"}
+    # Single pass: validates and emits tokens at the same time, errors point at the offending character
     normalized_text = text.lower()
     result = []
-    i = 0
+    group_start = None
+    previous = None
 
-    validate_characters(normalized_text, separators)
-    validate_duplicate_symbols(normalized_text, separators)
-    validate_symbol_counts(normalized_text)
-    validate_symbol_balance(normalized_text)
+    for i, char in enumerate(normalized_text):
+        if char in NOTES:
+            if group_start is None:
+                result.append(("bk", 0) if char == " " else ("1" + char, 0))
 
-    while i < len(normalized_text):
-        if normalized_text[i] not in separators:
-            if normalized_text[i] == " ":
-                result.append(("bk", 0))
-            else:
-                result.append(("1" + normalized_text[i], 0))
-            i += 1
+        elif char not in OPENING_SYMBOLS and char not in CLOSING_SYMBOLS:
+            raise PatternSyntaxError(f"El caracter '{char}' no es válido.", i + 1)
+
+        elif char == previous:
+            raise PatternSyntaxError(f"Símbolo '{char}' duplicado encontrado.", i + 1)
 
-        elif normalized_text[i] == "(":
-            # Process 1/6 patterns
-            pattern_result, skip_count = process_1_6_patterns(normalized_text, i)
-            result.extend(pattern_result)
-            i += skip_count
+        elif char in OPENING_SYMBOLS:
+            if group_start is not None:
+                raise PatternSyntaxError("No se pueden poner paréntesis o corchetes dentro de sí mismos.", i + 1)
+            group_start = i
 
-        elif normalized_text[i] == "[":
-            # Process 1/8 patterns
-            pattern_result, skip_count = process_1_8_patterns(normalized_text, i)
-            result.extend(pattern_result)
-            i += skip_count
+        elif char in CLOSING_SYMBOLS:
+            if group_start is None:
+                raise PatternSyntaxError("Símbolo de cierre sin su símbolo de apertura correspondiente.", i + 1)
+            if normalized_text[group_start] != CLOSING_SYMBOLS[char]:
+                raise PatternSyntaxError("No concuerda el símbolo de clausura con el de apertura.", i + 1)
+            result.extend(expand_group(normalized_text[group_start], normalized_text[group_start + 1:i]))
+            group_start = None
+
+        previous = char
+
+    if group_start is not None:
+        raise PatternSyntaxError("Paréntesis o corchetes desbalanceados.", group_start + 1)
 
     return result
 
 
-def create_beatmap_image(image_paths):
-    images = [Image.open(img) for img in image_paths]
+# Left margin of the PNG montage, see create_beatmap_image
+BEATMAP_MARGIN = 16
 
-    # widths, heights = zip(*(i.size for i in images)) # useful but not used
+
+def create_beatmap_image(tiles, x_offsets):
+    # Imported here, the bot process only needs the parser from this module and shouldn't pay for NumPy and PIL
+    import numpy as np
+    from PIL import Image
+    from compositor import composite_row
 
     # Total width should be 1984px but discord crop makes 2016px prettier, this means a horizontal margin of 16px
     total_width = 2016
     max_height = 124
 
-    map_image = Image.new('RGBA', (total_width, max_height))
-
-    x_offset = 16
-    for img in images:
-        map_image.paste(img, (x_offset, 0), img)
-        x_offset += img.size[0]
+    canvas = np.zeros((max_height, total_width, 4), dtype=np.uint8)
 
-    return map_image
+    return Image.fromarray(composite_row(canvas, tiles, x_offsets.tolist()), "RGBA")
 
 
 if __name__ == "__main__":